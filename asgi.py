@@ -0,0 +1,274 @@
+# ASGI entry point, for serving the observer from an asyncio-based server such as uvicorn or
+# hypercorn rather than uwsgi, e.g.:
+#
+#     OBSERVER_NETWORK=mainnet uvicorn --uds mainnet.sock asgi:app
+#
+# where OBSERVER_NETWORK names the network module (mainnet, testnet, devnet, ...) to load the config
+# from.
+#
+# With uwsgi each worker is tied up for as long as oxend takes to answer the requests of the page it
+# is serving.  Here, the oxend requests a route needs are instead sent and awaited on the event loop
+# (see `prefetchers` below), so that a single process can have hundreds of requests waiting on oxend
+# at once.  Once they have arrived (and thus are cached) the regular Flask route runs, in a thread
+# pool, to build the response; since its requests are answered from the cache that takes very
+# little time.  Routes without a prefetcher still work, but wait on oxend in their thread.
+
+import asyncio
+import concurrent.futures
+import importlib
+import io
+import os
+import sys
+import config
+from werkzeug.exceptions import HTTPException
+
+importlib.import_module(os.environ.get('OBSERVER_NETWORK', 'mainnet'))
+
+import observer
+from observer import (get_sns_future, get_quorums_future, sn_req, tx_req, block_with_txs_req,
+        block_header_req, get_block_txs_future, block_range_req, block_range_txs_req, ons_info)
+from lmq import FutureJSON, omq_connection
+
+
+# Functions that take the route arguments and return the FutureJSON requests (or, for requests that
+# depend on an earlier result, coroutines awaiting them) that the route is going to make, keyed by
+# the name of the Flask view function.  Requests must be made exactly as the route makes them (the
+# same endpoints, arguments, and cache keys) to be of any use.
+prefetchers = {}
+
+def prefetcher(*endpoints):
+    def register(f):
+        for e in endpoints:
+            prefetchers[e] = f
+        return f
+    return register
+
+
+def info_req(omq, oxend):
+    return FutureJSON(omq, oxend, 'rpc.get_info', 1)
+
+
+async def in_thread(f, *args):
+    """Runs f(*args) in a thread, off the event loop, for anything that touches sqlite: the chain
+    index, and the persistent cache, which the requests for finalized blocks and transactions (those
+    with a `final_height`) look in when they are made."""
+    return await asyncio.get_running_loop().run_in_executor(None, f, *args)
+
+
+async def final_req(f, omq, oxend, *args):
+    """Makes (in a thread, see `in_thread`) and awaits a request for finalized blocks or
+    transactions, e.g. `await final_req(tx_req, omq, oxend, txids)`"""
+    req = await in_thread(f, omq, oxend, *args)
+    return await req if req is not None else None
+
+
+def indexed_top():
+    index = observer.get_chain_index()
+    return index.top() if index else None
+
+
+async def prefetch_block_range(omq, oxend, page=0, per_page=None, first=None, last=None):
+    info = await info_req(omq, oxend)
+    if not info:
+        return
+    start_height, end_height = observer.index_range(info['height'], page, per_page, first, last)[:2]
+    # Served from the chain index (without oxend) if it has the blocks
+    top = await in_thread(indexed_top)
+    if top and top[0] >= end_height:
+        return
+    headers = await final_req(block_range_req, omq, oxend, start_height, end_height)
+    if headers and 'headers' in headers:
+        await final_req(block_range_txs_req, omq, oxend, headers['headers'])
+
+@prefetcher('main')
+def prefetch_main(omq, oxend, page=0, per_page=None, first=None, last=None, **args):
+    return [info_req(omq, oxend),
+            prefetch_block_range(omq, oxend, page, per_page, first, last),
+            FutureJSON(omq, oxend, 'rpc.get_transaction_pool_hashes', 5),
+            FutureJSON(omq, oxend, 'rpc.get_staking_requirement', 10),
+            FutureJSON(omq, oxend, 'rpc.get_fee_estimate', 10),
+            FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10),
+            FutureJSON(omq, oxend, 'rpc.get_accrued_batched_earnings', 1),
+            FutureJSON(omq, oxend, 'rpc.get_checkpoints', args={"count": 3}),
+            get_sns_future(omq, oxend)]
+
+@prefetcher('sns', 'api_service_nodes', 'api_service_node_changes')
+def prefetch_sns(omq, oxend, **args):
+    return [info_req(omq, oxend), get_sns_future(omq, oxend)]
+
+@prefetcher('api_service_node_stats')
+def prefetch_sn_stats(omq, oxend, **args):
+    return [info_req(omq, oxend), get_sns_future(omq, oxend),
+            FutureJSON(omq, oxend, 'rpc.get_staking_requirement', 30)]
+
+@prefetcher('api_networkinfo')
+def prefetch_networkinfo(omq, oxend, **args):
+    return [info_req(omq, oxend), FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10)]
+
+async def prefetch_quorums(omq, oxend):
+    info = await info_req(omq, oxend)
+    if info:
+        await get_quorums_future(omq, oxend, info['height'])
+
+@prefetcher('show_quorums')
+def prefetch_show_quorums(omq, oxend, **args):
+    return [prefetch_quorums(omq, oxend)]
+
+@prefetcher('show_sn')
+def prefetch_show_sn(omq, oxend, pubkey, **args):
+    return [FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10), sn_req(omq, oxend, pubkey),
+            prefetch_quorums(omq, oxend)]
+
+async def prefetch_block_txs(omq, oxend, block_req, next_header=False):
+    block = await block_req
+    if not block or 'block_header' not in block:
+        return
+    reqs = [final_req(get_block_txs_future, omq, oxend, block)]
+    if next_header:
+        info = await info_req(omq, oxend)
+        height = block['block_header']['height']
+        if info and info['height'] > 1 + height:
+            reqs.append(final_req(block_header_req, omq, oxend, '{}'.format(height + 1)))
+    await asyncio.gather(*reqs)
+
+@prefetcher('show_block')
+def prefetch_show_block(omq, oxend, height=None, hash=None, **args):
+    block = final_req(block_with_txs_req, omq, oxend, height if height is not None else hash)
+    return [info_req(omq, oxend), FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10),
+            prefetch_block_txs(omq, oxend, block, next_header=True)]
+
+@prefetcher('api_block')
+def prefetch_api_block(omq, oxend, blkid=None, height=None, **args):
+    block = final_req(block_with_txs_req, omq, oxend, blkid if blkid is not None else height)
+    return [info_req(omq, oxend), prefetch_block_txs(omq, oxend, block)]
+
+@prefetcher('show_ons')
+def prefetch_show_ons(omq, oxend, name, **args):
+    name = name.lower()
+    reqs = [info_req(omq, oxend)]
+    if observer.valid_ons_name(name):
+        reqs.append(ons_info(omq, oxend, name))
+    return reqs
+
+@prefetcher('show_tx', 'api_tx')
+def prefetch_tx(omq, oxend, txid, **args):
+    return [info_req(omq, oxend), final_req(tx_req, omq, oxend, [txid])]
+
+
+async def prefetch(environ):
+    """Sends (and waits for) the oxend requests that the route for the request will need"""
+    try:
+        endpoint, args = observer.app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        # Not found, redirect, etc.: let Flask deal with it
+        return
+    f = prefetchers.get(endpoint)
+    if f is None:
+        return
+    omq, oxend = omq_connection()
+    # Failures don't matter here: the route will retry (and deal with) them
+    await asyncio.gather(*f(omq, oxend, **args), return_exceptions=True)
+
+
+# Threads in which the Flask app itself runs
+wsgi_threads = concurrent.futures.ThreadPoolExecutor(max_workers=config.asgi_wsgi_threads, thread_name_prefix='wsgi')
+# Threads that pull the chunks of streamed responses (which can block for a long time waiting for the
+# next chunk, so they get their own threads rather than holding up regular requests)
+stream_threads = concurrent.futures.ThreadPoolExecutor(max_workers=config.asgi_stream_threads, thread_name_prefix='stream')
+
+def wsgi_environ(scope, body):
+    # WSGI wants the (percent-decoded) paths as "bytes-as-latin1" strings.  (Not raw_path, which is
+    # still percent-encoded.)
+    path = scope['path']
+    script_name = scope.get('root_path', '')
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode().decode('latin1'),
+        'PATH_INFO': path.encode().decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            name = 'HTTP_' + name
+            environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    environ = wsgi_environ(scope, body)
+    await prefetch(environ)
+
+    loop = asyncio.get_running_loop()
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+    result = await loop.run_in_executor(wsgi_threads, observer.app, environ, start_response)
+
+    # Responses can be streamed (i.e. /events), in which case we pull each chunk in a thread and
+    # stop (closing the response, which lets it clean up) if the client goes away.
+    disconnected = asyncio.ensure_future(receive())
+    chunks = iter(result)
+    chunk = None
+    started = False
+    try:
+        while True:
+            chunk = loop.run_in_executor(stream_threads if started else wsgi_threads, next, chunks, None)
+            await asyncio.wait([chunk, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if not chunk.done():
+                # Client disconnected
+                break
+            data = chunk.result()
+            if not started:
+                await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                started = True
+            if data is None:
+                await send({'type': 'http.response.body', 'body': b''})
+                break
+            if data:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        if hasattr(result, 'close'):
+            # Can't close the response while a thread is still pulling a chunk from it
+            if chunk is not None and not chunk.done():
+                chunk.add_done_callback(lambda _: stream_threads.submit(result.close))
+            else:
+                wsgi_threads.submit(result.close)
@@ -1,168 +1,128 @@
-# MoneroPy - A python toolbox for Monero
+# Monero-style base58 encoding, as used for Oxen addresses.
+#
+# Originally based on MoneroPy - A python toolbox for Monero
 # Copyright (C) 2016 The MoneroPy Developers.
 #
 # MoneroPy is released under the BSD 3-Clause license. Use and redistribution of
 # this software is subject to the license terms in the LICENSE file found in the
 # top-level directory of this distribution.
-
-__alphabet = [ord(s) for s in '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz']
-__b58base = 58
-__UINT64MAX = 2**64
-__encodedBlockSizes = [0, 2, 3, 5, 6, 7, 9, 10, 11]
-__fullBlockSize = 8
-__fullEncodedBlockSize = 11
-
-def _hexToBin(hex):
-    if len(hex) % 2 != 0:
-        return "Hex string has invalid length!"
-    return [int(hex[i*2:i*2+2], 16) for i in range(len(hex)//2)]
-
-def _binToHex(bin):
-    return "".join([("0" + hex(int(bin[i])).split('x')[1])[-2:] for i in range(len(bin))])
-
-def _strToBin(a):
-    return [ord(s) for s in a]
-
-def _binToStr(bin):
-    return ''.join([chr(bin[i]) for i in range(len(bin))])
-
-def _uint8be_to_64(data):
-    l_data = len(data)
-
-    if l_data < 1 or l_data > 8:
-        return "Invalid input length"
-
-    res = 0
-    switch = 9 - l_data
-    for i in range(l_data):
-        if switch == 1:
-            res = res << 8 | data[i]
-        elif switch == 2:
-            res = res << 8 | data[i]
-        elif switch == 3:
-            res = res << 8 | data[i]
-        elif switch == 4:
-            res = res << 8 | data[i]
-        elif switch == 5:
-            res = res << 8 | data[i]
-        elif switch == 6:
-            res = res << 8 | data[i]
-        elif switch == 7:
-            res = res << 8 | data[i]
-        elif switch == 8:
-            res = res << 8 | data[i]
-        else:
-            return "Impossible condition"
-    return res
-
-def _uint64_to_8be(num, size):
-    res = [0] * size;
-    if size < 1 or size > 8:
-        return "Invalid input length"
-
-    twopow8 = 2**8
-    for i in range(size-1,-1,-1):
-        res[i] = num % twopow8
-        num = num // twopow8
-
+#
+# Unlike regular base58, Monero's base58 encodes data in 8-byte blocks, each of which becomes 11
+# base58 characters (padded with leading '1's), with a shorter final block for any remaining bytes.
+
+alphabet = b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+b58base = 58
+full_block_size = 8
+full_encoded_block_size = 11
+# Encoded size of a block of 0 to 8 bytes:
+encoded_block_sizes = [0, 2, 3, 5, 6, 7, 9, 10, 11]
+# Decoded size of an encoded block of 0 to 11 characters (-1 for sizes that can't occur):
+decoded_block_sizes = [-1] * (full_encoded_block_size + 1)
+for _size, _enc_size in enumerate(encoded_block_sizes):
+    decoded_block_sizes[_enc_size] = _size
+
+# Character value => digit lookup table (-1 for invalid characters)
+digits = [-1] * 256
+for _i, _c in enumerate(alphabet):
+    digits[_c] = _i
+
+# Size of the checksum at the end of an address
+checksum_size = 4
+
+
+def encode_block(data):
+    """Encodes a block of up to 8 bytes"""
+    num = int.from_bytes(data, 'big')
+    res = bytearray(alphabet[:1] * encoded_block_sizes[len(data)])
+    i = len(res) - 1
+    while num > 0:
+        num, remainder = divmod(num, b58base)
+        res[i] = alphabet[remainder]
+        i -= 1
     return res
 
-def encode_block(data, buf, index):
-    l_data = len(data)
-
-    if l_data < 1 or l_data > __fullEncodedBlockSize:
-        return "Invalid block length: " + str(l_data)
 
-    num = _uint8be_to_64(data)
-    i = __encodedBlockSizes[l_data] - 1
-
-    while num > 0:
-        remainder = num % __b58base
-        num = num // __b58base
-        buf[index+i] = __alphabet[remainder];
-        i -= 1
+def decode_block(data):
+    """Decodes a block of up to 11 base58 characters (as bytes)"""
+    size = decoded_block_sizes[len(data)]
+    if size <= 0:
+        raise ValueError("Invalid base58 block size")
+    num = 0
+    for c in data:
+        d = digits[c]
+        if d < 0:
+            raise ValueError("Invalid base58 character {!r}".format(chr(c)))
+        num = num * b58base + d
+    if num >= 1 << (8 * size):
+        raise ValueError("Invalid base58 block value")
+    return num.to_bytes(size, 'big')
+
+
+def encode_bytes(data):
+    """Encodes bytes as a base58 string"""
+    res = bytearray()
+    for i in range(0, len(data), full_block_size):
+        res += encode_block(data[i:i+full_block_size])
+    return res.decode()
+
+
+def decode_bytes(enc):
+    """Decodes a base58 string into bytes; raises a ValueError if it isn't valid base58"""
+    if isinstance(enc, str):
+        try:
+            enc = enc.encode('ascii')
+        except UnicodeEncodeError:
+            raise ValueError("Invalid base58 character")
+    res = bytearray()
+    for i in range(0, len(enc), full_encoded_block_size):
+        res += decode_block(enc[i:i+full_encoded_block_size])
+    return bytes(res)
 
-    return buf
 
 def encode(hex):
     '''Encode hexadecimal string as base58 (ex: encoding a Monero address).'''
-    data = _hexToBin(hex)
-    l_data = len(data)
+    return encode_bytes(bytes.fromhex(hex))
 
-    if l_data == 0:
-        return ""
 
-    full_block_count = l_data // __fullBlockSize
-    last_block_size = l_data % __fullBlockSize
-    res_size = full_block_count * __fullEncodedBlockSize + __encodedBlockSizes[last_block_size]
-
-    res = [0] * res_size
-    for i in range(res_size):
-        res[i] = __alphabet[0]
-
-    for i in range(full_block_count):
-        res = encode_block(data[(i*__fullBlockSize):(i*__fullBlockSize+__fullBlockSize)], res, i * __fullEncodedBlockSize)
-
-    if last_block_size > 0:
-        res = encode_block(data[(full_block_count*__fullBlockSize):(full_block_count*__fullBlockSize+last_block_size)], res, full_block_count * __fullEncodedBlockSize)
-
-    return _binToStr(res)
-
-def decode_block(data, buf, index):
-    l_data = len(data)
-
-    if l_data < 1 or l_data > __fullEncodedBlockSize:
-        return "Invalid block length: " + l_data
-
-    res_size = __encodedBlockSizes.index(l_data)
-    if res_size <= 0:
-        return "Invalid block size"
-
-    res_num = 0
-    order = 1
-    for i in range(l_data-1, -1, -1):
-        digit = __alphabet.index(data[i])
-        if digit < 0:
-            return "Invalid symbol"
-
-        product = order * digit + res_num
-        if product > __UINT64MAX:
-            return "Overflow"
+def decode(enc):
+    '''Decode a base58 string (ex: a Monero address) into hexidecimal form.'''
+    return decode_bytes(enc).hex()
 
-        res_num = product
-        order = order * __b58base
 
-    if res_size < __fullBlockSize and 2**(8 * res_size) <= res_num:
-        return "Overflow 2"
+def encode_many(values):
+    """Encodes each of an iterable of bytes values; returns a list of base58 strings"""
+    return [encode_bytes(v) for v in values]
 
-    tmp_buf = _uint64_to_8be(res_num, res_size)
-    for i in range(len(tmp_buf)):
-        buf[i+index] = tmp_buf[i]
 
-    return buf
+def decode_many(values):
+    """Decodes each of an iterable of base58 strings; returns a list of bytes values"""
+    return [decode_bytes(v) for v in values]
 
-def decode(enc):
-    '''Decode a base58 string (ex: a Monero address) into hexidecimal form.'''
-    enc = _strToBin(enc)
-    l_enc = len(enc)
 
-    if l_enc == 0:
-        return ""
+def address_checksum(data):
+    from Cryptodome.Hash import keccak
+    return keccak.new(digest_bits=256, data=data).digest()[:checksum_size]
 
-    full_block_count = l_enc // __fullEncodedBlockSize
-    last_block_size = l_enc % __fullEncodedBlockSize
-    last_block_decoded_size = __encodedBlockSizes.index(last_block_size)
 
-    if last_block_decoded_size < 0:
-        return "Invalid encoded length"
+def encode_address(data):
+    """Encodes address data (i.e. the network tag byte(s) followed by the keys and, for integrated
+    addresses, the payment id) as an address, appending the checksum."""
+    return encode_bytes(data + address_checksum(data))
 
-    data_size = full_block_count * __fullBlockSize + last_block_decoded_size
 
-    data = [0] * data_size
-    for i in range(full_block_count):
-        data = decode_block(enc[(i*__fullEncodedBlockSize):(i*__fullEncodedBlockSize+__fullEncodedBlockSize)], data, i * __fullBlockSize)
+def decode_address(address):
+    """Decodes an address, verifying its checksum, and returns the address data (without the
+    checksum).  Raises a ValueError if the address isn't valid base58 or has a bad checksum."""
+    data = decode_bytes(address)
+    if len(data) <= checksum_size or address_checksum(data[:-checksum_size]) != data[-checksum_size:]:
+        raise ValueError("Invalid address checksum")
+    return data[:-checksum_size]
 
-    if last_block_size > 0:
-        data = decode_block(enc[(full_block_count*__fullEncodedBlockSize):(full_block_count*__fullEncodedBlockSize+last_block_size)], data, full_block_count * __fullBlockSize)
 
-    return _binToHex(data)
\ No newline at end of file
+def valid_address(address):
+    """Returns True if `address` is a base58 string with a valid address checksum"""
+    try:
+        decode_address(address)
+        return True
+    except ValueError:
+        return False
@@ -17,6 +17,65 @@ blocks_per_page=20
 # Maximum blocks per page a user can request
 max_blocks_per_page=100
 
+# Default and maximum transactions per page for the mempool page and API:
+mempool_per_page=100
+max_mempool_per_page=1000
+
+# Default and maximum service nodes per page for the service node API:
+sn_per_page=100
+max_sn_per_page=1000
+
+# How many service node changes (registrations, decommissions, uptime proofs, etc.) to keep for
+# /api/service_nodes/changes pollers.
+sn_changes_max=10000
+# Path to a sqlite database in which to keep the service node changes, shared by all the observer
+# processes using it.  Each network needs its own file, so this is set in mainnet.py/testnet.py/etc.
+# If None each process keeps its own changes, which only works when running a single process:
+# with more than one uwsgi process the change feed refuses to run without it.
+sn_changes_db = None
+
+# How long to cache ONS lookups (these only change with a new block, so when we get block
+# notifications from oxend they are refreshed as soon as one arrives), and how many decrypted ONS
+# mappings to keep in memory.
+ons_cache_seconds=60
+ons_mapping_cache_size=1000
+
+# Compiled templates are cached on disk so that new (or reloaded) workers don't have to recompile
+# them all: True uses a directory in the system temp dir; otherwise set this to the (existing)
+# directory to use, or to None to disable.  If `warm_templates` is set then every template is
+# compiled when the observer is loaded (which, unless uwsgi is using lazy-apps, happens once in the
+# master process rather than in each worker) instead of on first use.  Since templates are
+# compiled as soon as the observer is loaded, set these in local_config.py.
+template_cache = True
+warm_templates = False
+
+# How many rendered service node QR code images (see /qr/...) to keep in memory
+qr_cache_size = 500
+
+# Syntax-highlighted "more details" JSON is cached (up to the given number of entries and total
+# size, for up to `details_cache_seconds`); JSON larger than `details_highlight_max` characters is
+# shown as plain text rather than highlighted.
+details_cache_entries = 100
+details_cache_bytes = 32*1024*1024
+details_cache_seconds = 3600
+details_highlight_max = 512*1024
+
+# Coin prices for /api/prices are fetched from CoinGecko (or a compatible API at `price_api_url`)
+# in the background every `price_refresh_interval` seconds (and the list of currencies every
+# `price_currencies_refresh_interval` seconds), waiting at most `price_timeout` seconds for a
+# response.  If fetching fails the last prices we got continue to be served.
+price_api_url = 'https://api.coingecko.com/api/v3'
+# TODO: will need to change to 'oxen' when/if the ticker changes:
+price_ticker = 'loki-network'
+price_refresh_interval = 60
+price_currencies_refresh_interval = 300
+price_timeout = 5
+
+# When serving via ASGI (see asgi.py), the maximum number of threads used to run the regular
+# (non-async) Flask routes, and to stream responses (one per connected /events client).
+asgi_wsgi_threads = 32
+asgi_stream_threads = 256
+
 # Some display and/or feature options:
 pusher=False
 key_image_checker=False
@@ -33,3 +92,100 @@ devnet_url='https://devnet.oxen.observer'
 lokinet_mainnet_url='http://blocks.loki'
 lokinet_testnet_url='http://testnet.loki'
 lokinet_devnet_url='http://devnet.kcpyawm9se7trdbzncimdi5t7st4p5mh9i1mg7gkpuubi4k4ku1y.loki'
+
+# Limits on the per-process cache of RPC responses: the least recently used responses are evicted
+# when there are more than this many entries, or when the (raw) responses exceed this many bytes.
+cache_max_entries = 1000
+cache_max_bytes = 64*1024*1024
+# The cache is split into this many independently locked stripes (each holding 1/Nth of the above
+# limits) so that threads looking up different requests don't wait on each other.  Note that a
+# single response larger than cache_max_bytes / cache_stripes won't be cached.
+cache_stripes = 8
+
+# RPC endpoints to keep refreshed in a background thread (ahead of their cache expiry) so that pages
+# using them can be served from memory without waiting on oxend.  Only requests made with the
+# default cache_key are refreshed.  When running under uwsgi this requires `enable-threads = true`.
+refresh_endpoints = {
+    'rpc.get_info', 'rpc.get_staking_requirement', 'rpc.get_fee_estimate', 'rpc.hard_fork_info',
+    'rpc.get_accrued_batched_earnings', 'rpc.get_transaction_pool_hashes', 'rpc.get_service_nodes',
+    'rpc.get_checkpoints'}
+# Background-refreshed requests that haven't been used by any page for this many seconds stop
+# being refreshed.
+refresh_idle = 300
+# How long past its expiry a background-refreshed value may still be served while waiting for the
+# refresh to complete.  Past this, requests wait for oxend as usual.
+refresh_max_stale = 30
+
+# Path to a sqlite database in which to permanently store responses tied to blocks that are at
+# least `finality_depth` blocks deep (i.e. that will never change): blocks, transactions and block
+# header ranges.  These are then served from disk rather than oxend, even after a restart.  Each
+# network needs its own file, so set this in mainnet.py/testnet.py/etc.  None disables it.
+persistent_cache = None
+finality_depth = 30
+
+# The circulating supply figures (emission, fees and burned coins) are tallied incrementally in the
+# background, every `emission_poll_interval` seconds, rather than rescanning the whole chain for
+# every request (see emission.py).  Catching up from stored totals is done `emission_batch_blocks`
+# at a time, allowing up to `emission_timeout` seconds per request.  Failed updates are retried with
+# a doubling delay, up to `emission_max_backoff` seconds.  If `emission_db` is set to a sqlite
+# database path the totals are stored there so that they aren't recalculated from scratch after a
+# restart, and are shared by all the processes using the file.  Each network needs its own file, so
+# this is set in mainnet.py/testnet.py/etc.; None disables it.
+emission_db = None
+emission_poll_interval = 5
+emission_batch_blocks = 50000
+emission_timeout = 60
+emission_max_backoff = 300
+
+# Path to the sqlite database maintained by the chain indexer (see indexer.py, which needs to be
+# running for this to be useful).  When set, the index page and block ranges are served from the
+# index whenever it has all the needed blocks.  Each network needs its own file, so set this in
+# mainnet.py/testnet.py/etc.  None disables it.
+index_db = None
+# When starting with an empty index, the indexer starts this many blocks before the current height:
+index_initial_blocks = 10000
+# How many blocks the indexer requests from oxend at once:
+index_batch_size = 100
+# How often (in seconds) the indexer checks for new blocks once caught up:
+index_poll_interval = 1
+
+# Whether to subscribe to oxend's new block and mempool notifications to invalidate cached values
+# as soon as the chain or mempool changes.  While subscribed, affected values are cached for at
+# least `notify_fallback_ttl` seconds (as a fallback in case a notification is missed).
+notifications = True
+notify_fallback_ttl = 30
+
+# The index, mempool, service node and quorum list pages are cached once rendered until the chain
+# height or mempool changes, but for no longer than this many seconds (so that displayed ages stay
+# reasonably current).  0 disables the rendered page cache.
+page_cache_seconds = 5
+# Limits on the number and (total) size of cached rendered pages:
+page_cache_entries = 200
+page_cache_bytes = 32*1024*1024
+
+# HTTP caching: live pages (the index, mempool, service node and quorum lists) may be cached by
+# browsers and proxies for `live_max_age` seconds (0 to disallow); pages and API responses for final
+# blocks and transactions (see `finality_depth`) are marked immutable and cacheable for
+# `immutable_max_age` seconds.  Everything else is sent with `Cache-Control: no-store`.
+live_max_age = 5
+immutable_max_age = 365*86400
+
+# If enabled, the index page in autorefresh mode updates itself in place from a server-sent event
+# stream (/events) rather than reloading itself every few seconds.  Each open page holds a request
+# (and, with uwsgi, a worker thread) open for as long as it stays open, so only enable this if the
+# server can hold as many open requests as you expect open pages, on top of regular traffic: for
+# example when serving via asgi.py (see `asgi_stream_threads`), or with a uwsgi vassal config
+# providing enough threads (see the README).  Otherwise a few open pages tie up every worker.
+live_updates = False
+# The event stream is fed by one background poller per process, which checks for changes every
+# `live_poll_interval` seconds while anyone is listening.  Clients that fall more than
+# `live_queue_size` events behind are disconnected.
+live_poll_interval = 1
+live_queue_size = 100
+
+# Name of a uwsgi cache to use for caching RPC responses; when set (and running under uwsgi) a
+# single cache is shared by all uwsgi worker processes rather than each worker keeping its own.  The
+# cache must be configured in the uwsgi .ini file, for example:
+#     cache2 = name=observer,items=4096,blocksize=65536,blocks=2048,bitmap=1
+# (the blocks need to be able to hold the largest responses, such as the service node list).
+uwsgi_cache = None
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the base58 codec (base58.py) against the original implementation it replaced (kept in
+# tests/base58_reference.py), on address-sized values.
+#
+# Usage (from the top-level directory):
+#
+#     python3 contrib/bench_base58.py [ITERATIONS]
+
+import os
+import sys
+import timeit
+
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, top)
+sys.path.insert(0, os.path.join(top, 'tests'))
+
+import base58
+import base58_reference as reference
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # Sizes of a (primary or sub-) address and an integrated address, with checksums
+    for size in (69, 77):
+        data = os.urandom(size)
+        hex = data.hex()
+        enc = base58.encode(hex)
+        print("{} bytes ({} characters):".format(size, len(enc)))
+        results = [
+            ("encode (hex), old", lambda: reference.encode(hex)),
+            ("encode (hex), new", lambda: base58.encode(hex)),
+            ("encode_bytes", lambda: base58.encode_bytes(data)),
+            ("decode (hex), old", lambda: reference.decode(enc)),
+            ("decode (hex), new", lambda: base58.decode(enc)),
+            ("decode_bytes", lambda: base58.decode_bytes(enc)),
+        ]
+        times = {}
+        for name, f in results:
+            t = timeit.timeit(f, number=iterations) / iterations
+            times[name] = t
+            print("    {:<20} {:8.2f} µs".format(name, t * 1e6))
+        print("    encode speedup: {:.1f}x, decode speedup: {:.1f}x".format(
+            times["encode (hex), old"] / times["encode (hex), new"],
+            times["decode (hex), old"] / times["decode (hex), new"]))
+
+
+if __name__ == '__main__':
+    main()
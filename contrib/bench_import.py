@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Benchmarks how long loading the observer (`import observer`, which is what every new or reloaded
+# uwsgi worker does first) takes, using `python -X importtime`, optionally against another git
+# revision (e.g. one from before dependencies were loaded on first use).  Each run is a new process;
+# the best run is reported, along with the modules that took the longest to import (cumulative
+# time, i.e. including the modules they import) and the observer's own modules.  Needs the
+# observer's dependencies (flask, oxenmq, ...) installed, but no oxend.
+#
+# Usage (from the top-level directory):
+#
+#     python3 contrib/bench_import.py [--baseline GIT_REV] [--runs N] [--top N]
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+own_modules = {os.path.splitext(f)[0] for f in os.listdir(top) if f.endswith('.py')}
+
+
+def import_times(path):
+    """Imports the observer from `path` in a new process; returns {module: (self_us, cumulative_us)}"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import observer'], cwd=path,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'), check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    times = {}
+    for line in out.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+
+def best_of(path, runs):
+    results = [import_times(path) for _ in range(runs)]
+    return min(results, key=lambda t: t['observer'][1])
+
+
+def report(name, times, top_n):
+    print("{}: import observer took {:.1f} ms\n".format(name, times['observer'][1] / 1000))
+    # Only top-level entries of each import (e.g. `asyncio`, not `asyncio.events`) so that
+    # time isn't counted twice:
+    tops = sorted(((c, m) for m, (s, c) in times.items() if '.' not in m and m != 'observer'), reverse=True)
+    print("    slowest imports (cumulative):")
+    for c, m in tops[:top_n]:
+        print("    {:>9.1f} ms  {}".format(c / 1000, m))
+    print("    observer modules (cumulative):")
+    for c, m in tops:
+        if m in own_modules:
+            print("    {:>9.1f} ms  {}".format(c / 1000, m))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the observer's import time")
+    parser.add_argument('--baseline', help="git revision to compare against")
+    parser.add_argument('--runs', type=int, default=5, help="number of runs (the best is reported)")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    current = best_of(top, args.runs)
+    report("current tree", current, args.top)
+
+    if args.baseline:
+        tmp = tempfile.mkdtemp(prefix='observer-bench-import-')
+        try:
+            archive = subprocess.run(['git', 'archive', args.baseline], cwd=top, check=True,
+                    stdout=subprocess.PIPE).stdout
+            subprocess.run(['tar', '-x', '-C', tmp], input=archive, check=True)
+            baseline = best_of(tmp, args.runs)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        report(args.baseline, baseline, args.top)
+        print("import observer: {:.1f} ms -> {:.1f} ms".format(
+            baseline['observer'][1] / 1000, current['observer'][1] / 1000))
+
+
+if __name__ == '__main__':
+    main()
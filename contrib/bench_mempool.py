@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the per-request cost of preparing the mempool for display: the old approach (parsing
+# the embedded tx json of every mempool tx on every request) against PoolTx (see txpool.py), which
+# converts each tx once when it enters the mempool and only parses the json of the txs that actually
+# get displayed.  Uses synthetic txs shaped like oxend's get_transactions results, so no oxend is
+# needed.
+#
+# Usage (from the top-level directory):
+#
+#     python3 contrib/bench_mempool.py [NUM_TXS [NUM_REQUESTS]]
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from txpool import pool_tx, mempool_page
+
+
+def fake_tx(i):
+    info = {
+        'version': 4,
+        'unlock_time': 0,
+        'type': 0,
+        'vin': [{'key': {'amount': 0, 'key_offsets': [random.randrange(1 << 24) for _ in range(10)],
+            'k_image': os.urandom(32).hex()}} for _ in range(2)],
+        'vout': [{'amount': 0, 'target': {'key': os.urandom(32).hex()}} for _ in range(2)],
+        'extra': list(os.urandom(70)),
+        'rct_signatures': {'type': 5, 'txnFee': random.randrange(10**7, 10**9),
+            'ecdhInfo': [{'amount': os.urandom(8).hex()} for _ in range(2)],
+            'outPk': [os.urandom(32).hex() for _ in range(2)]},
+        'rctsig_prunable': {'nbp': 1, 'bp': [{'A': os.urandom(32).hex(), 'S': os.urandom(32).hex(),
+            'L': [os.urandom(32).hex() for _ in range(7)], 'R': [os.urandom(32).hex() for _ in range(7)]}],
+            'CLSAGs': [{'s': [os.urandom(32).hex() for _ in range(10)], 'c1': os.urandom(32).hex(),
+                'D': os.urandom(32).hex()} for _ in range(2)],
+            'pseudoOuts': [os.urandom(32).hex() for _ in range(2)]},
+    }
+    tx_json = json.dumps(info, indent=2)
+    return {
+        'tx_hash': os.urandom(32).hex(),
+        'received_timestamp': 1600000000 + i,
+        'size': len(tx_json) // 2,
+        'relayed': True,
+        'extra': {},
+        'as_json': tx_json,
+    }
+
+
+def old_request(raw_txs):
+    # What parse_mempool used to do for every request
+    transactions = [dict(tx, id_hash=tx['tx_hash'], receive_time=tx['received_timestamp'], tx_json=tx['as_json'])
+            for tx in raw_txs]
+    transactions.sort(key=lambda tx: (tx['receive_time'], tx['id_hash']))
+    for tx in transactions:
+        tx['info'] = json.loads(tx['tx_json'])
+    return transactions[:25]
+
+
+def new_request(view):
+    # Index page: the 25 oldest txs; each displayed tx needs its info
+    txs = mempool_page(view, 'time', None, 0, 25)
+    for tx in txs:
+        tx['info']
+    return txs
+
+
+def new_request_sorted(view):
+    # Mempool page sorted by fee: 100 txs
+    txs = mempool_page(view, 'fee', None, 0, 100)
+    for tx in txs:
+        tx['info']
+    return txs
+
+
+def bench(name, f, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        f()
+    elapsed = time.perf_counter() - start
+    print("{:<40} {:9.3f} ms/request".format(name, elapsed / count * 1000))
+    return elapsed
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    random.seed(1)
+    raw_txs = [fake_tx(i) for i in range(num_txs)]
+    print("{} mempool txs, {:.1f} MB of embedded tx json, {} requests each\n".format(
+        num_txs, sum(len(tx['as_json']) for tx in raw_txs) / 1e6, requests))
+
+    start = time.perf_counter()
+    txs = [pool_tx(tx) for tx in raw_txs]
+    txs.sort(key=lambda tx: (tx['receive_time'], tx['id_hash']))
+    view = {'transactions': txs}
+    print("{:<40} {:9.3f} ms (once per new tx)".format("PoolTx conversion of all txs", (time.perf_counter() - start) * 1000))
+
+    old = bench("old: parse every tx per request", lambda: old_request(raw_txs), requests)
+    new = bench("new: PoolTx, parse displayed txs", lambda: new_request(view), requests)
+    bench("new: fee-sorted page", lambda: new_request_sorted(view), requests)
+    print("\nspeedup: {:.0f}x".format(old / new))
+
+
+if __name__ == '__main__':
+    main()
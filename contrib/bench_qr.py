@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# Benchmarks /qr throughput through the Flask app (via its test client, so without any web server
+# overhead): rendering every PNG (as every request used to), repeated requests for cached PNG and
+# SVG images, and revalidations answered with a 304 from the ETag.  Needs the observer's
+# dependencies (flask, qrcode, pillow, ...) installed, but no oxend.
+#
+# Usage (from the top-level directory):
+#
+#     python3 contrib/bench_qr.py [NUM_REQUESTS [NUM_PUBKEYS]]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import observer
+
+
+def bench(name, client, urls, count, headers=None, setup=None):
+    if setup:
+        setup()
+    statuses = set()
+    start = time.perf_counter()
+    for i in range(count):
+        if setup and i % len(urls) == 0:
+            setup()
+        r = client.get(urls[i % len(urls)], headers=headers)
+        statuses.add(r.status_code)
+    elapsed = time.perf_counter() - start
+    print("{:<44} {:9.1f} requests/s {:8.3f} ms/request (HTTP {})".format(
+        name, count / elapsed, elapsed / count * 1000, ', '.join(str(s) for s in sorted(statuses))))
+    return count / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_keys = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    pubkeys = [os.urandom(32).hex() for _ in range(num_keys)]
+    png = ['/qr/{}'.format(pk) for pk in pubkeys]
+    svg = ['/qr/{}.svg'.format(pk) for pk in pubkeys]
+    client = observer.app.test_client()
+    print("{} requests over {} service node pubkeys\n".format(count, num_keys))
+
+    # Warm up (imports, url map, etc.)
+    client.get(png[0])
+    client.get(svg[0])
+
+    uncached = bench("PNG, rendered every time (uncached)", client, png, count,
+            setup=observer.qr_image.cache_clear)
+    bench("SVG, rendered every time (uncached)", client, svg, count,
+            setup=observer.qr_image.cache_clear)
+    cached = bench("PNG, cached", client, png, count)
+    bench("SVG, cached", client, svg, count)
+
+    etag = client.get(png[0]).headers['ETag']
+    bench("PNG, If-None-Match revalidation (304)", client, png[:1], count, headers={'If-None-Match': etag})
+
+    print("\ncached vs uncached PNG: {:.0f}x".format(cached / uncached))
+    print("PNG size: {} bytes, SVG size: {} bytes".format(
+        len(client.get(png[0]).data), len(client.get(svg[0]).data)))
+
+
+if __name__ == '__main__':
+    main()
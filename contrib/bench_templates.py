@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the time to first response of the main pages in a freshly started observer process, as
+# a new or reloaded uwsgi worker sees it, with and without the compiled template cache and template
+# warming (see `template_cache` and `warm_templates` in config.py): before (no template cache) and
+# after (with the cache cold, i.e. still empty, and then warm).  Each mode runs in a new process,
+# which requests each route once through the Flask test client, timing the first response, and
+# then once more: the second response (with the templates compiled and the RPC results cached) is
+# what the page costs once warmed up.
+#
+# The pages need data from oxend, so this needs the network's oxend running (and the observer's
+# dependencies installed); the oxend time is included, but is much the same for every mode.
+#
+# Usage (from the top-level directory):
+#
+#     python3 contrib/bench_templates.py [--network mainnet] [--runs N] [--routes / /txpool ...]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+default_routes = ['/', '/txpool', '/service_nodes', '/quorums', '/block/latest', '/api/networkinfo']
+
+child = r'''
+import importlib, json, sys, time
+sys.path.insert(0, {top!r})
+import config
+config.template_cache = {cache!r}
+config.warm_templates = {warm!r}
+start = time.perf_counter()
+importlib.import_module({network!r})  # Loads the observer, with the network's config
+import observer
+loaded = time.perf_counter() - start
+client = observer.app.test_client()
+times = {{}}
+for route in {routes!r}:
+    t = []
+    for _ in range(2):
+        start = time.perf_counter()
+        r = client.get(route, follow_redirects=True)
+        t.append(time.perf_counter() - start)
+        if r.status_code != 200:
+            sys.exit("{{}} failed: HTTP {{}}".format(route, r.status_code))
+    times[route] = t
+print(json.dumps({{'load': loaded, 'routes': times}}))
+'''
+
+
+def run(args, cache, warm):
+    code = child.format(top=top, cache=cache, warm=warm, network=args.network, routes=args.routes)
+    out = subprocess.run([sys.executable, '-c', code], cwd=top, check=True, stdout=subprocess.PIPE)
+    return json.loads(out.stdout.decode().strip().splitlines()[-1])
+
+
+def bench(name, args, cache, warm, clear_cache=False):
+    results = []
+    for _ in range(args.runs):
+        if clear_cache:
+            shutil.rmtree(cache, ignore_errors=True)
+            os.mkdir(cache)
+        results.append(run(args, cache, warm))
+    print("{} (load: {:.1f} ms)".format(name, min(r['load'] for r in results) * 1000))
+    for route in args.routes:
+        first = min(r['routes'][route][0] for r in results)
+        second = min(r['routes'][route][1] for r in results)
+        print("    {:<24} first response {:8.1f} ms   warmed up {:8.1f} ms".format(route, first * 1000, second * 1000))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the pages' time to first response in a new process")
+    parser.add_argument('--network', default='mainnet', help="network module to load (mainnet, testnet, devnet, ...)")
+    parser.add_argument('--runs', type=int, default=3, help="number of runs of each mode (the best is reported)")
+    parser.add_argument('--routes', nargs='+', default=default_routes, help="routes to request")
+    args = parser.parse_args()
+
+    cache = tempfile.mkdtemp(prefix='observer-bench-templates-')
+    try:
+        print("best of {} runs, each in a new process\n".format(args.runs))
+        bench("before: no template cache", args, None, False)
+        bench("template cache, cold", args, cache, False, clear_cache=True)
+        run(args, cache, True)  # Populates the cache
+        bench("template cache, warm", args, cache, False)
+        bench("template cache, warm, + warm_templates", args, cache, True)
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
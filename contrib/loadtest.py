@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# Load test for comparing serving modes, in particular the regular (synchronous, uwsgi) mode against
+# the ASGI mode (asgi.py): sends requests for a mix of pages from many concurrent clients to each of
+# the given observers in turn and reports the throughput, errors and latencies of each.  Only uses
+# the standard library.
+#
+# Run both observers against the same oxend, and with similar resources (e.g. a uwsgi config with
+# the usual processes and threads against a single uvicorn process), e.g. the usual uwsgi vassal
+# with an added `http-socket = :8001`, and:
+#
+#     OBSERVER_NETWORK=devnet uvicorn --port 8002 asgi:app
+#
+# then:
+#
+#     python3 contrib/loadtest.py --concurrency 200 --duration 30 http://localhost:8001 http://localhost:8002
+#
+# The difference shows up once there are more concurrent clients than the synchronous mode has
+# worker threads, and the more so the slower oxend is to answer (e.g. on a busy node, or with the
+# RPC cache cold: use --paths with distinct blocks or txs to defeat it).
+
+import argparse
+import concurrent.futures
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+default_paths = ['/', '/page/1', '/service_nodes', '/quorums', '/txpool', '/api/networkinfo',
+        '/api/service_node_stats', '/block/latest']
+
+
+def fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+            ok = r.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run(base_url, paths, concurrency, duration, timeout):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        nonlocal errors
+        i = n
+        while time.perf_counter() < deadline:
+            ok, elapsed = fetch(base_url + paths[i % len(paths)], timeout)
+            i += 1
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for f in [pool.submit(client, n) for n in range(concurrency)]:
+            f.result()
+    elapsed = time.perf_counter() - start
+
+    print("{}:".format(base_url))
+    print("    {} ok, {} failed in {:.1f}s: {:.1f} requests/s".format(len(latencies), errors, elapsed, len(latencies) / elapsed))
+    if latencies:
+        q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print("    latency: median {:.0f} ms, p90 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms".format(
+            q[49] * 1000, q[89] * 1000, q[98] * 1000, max(latencies) * 1000))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test one or more observers")
+    parser.add_argument('urls', nargs='+', help="base URL of each observer to test, e.g. http://localhost:8001")
+    parser.add_argument('--concurrency', type=int, default=100, help="number of concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run against each observer")
+    parser.add_argument('--timeout', type=float, default=30, help="per-request timeout (counted as a failure)")
+    parser.add_argument('--paths', nargs='+', default=default_paths, help="paths to request (in turn)")
+    args = parser.parse_args()
+
+    print("{} clients for {}s each, requesting: {}\n".format(args.concurrency, args.duration, ' '.join(args.paths)))
+    for url in args.urls:
+        # Warm up (connections to oxend, templates, caches) before measuring
+        for path in args.paths:
+            fetch(url.rstrip('/') + path, args.timeout)
+        run(url.rstrip('/'), args.paths, args.concurrency, args.duration, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
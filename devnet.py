@@ -2,3 +2,5 @@ from observer import app, config
 import oxenmq
 
 config.oxend_rpc = oxenmq.Address('ipc://oxend/devnet.sock')
+config.emission_db = 'devnet-emission.db'
+config.sn_changes_db = 'devnet-sn-changes.db'
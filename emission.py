@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import sys
+import time
+import threading
+import config
+from lmq import omq_connection, FutureJSON
+
+
+class EmissionTally():
+    """Running totals of coinbase emission, fees and burned coins over the whole chain.
+
+    Rather than asking oxend to rescan the entire chain (via admin.get_coinbase_tx_sum) for every
+    request, a background thread keeps an accumulator of the totals up to a height that is
+    `config.finality_depth` blocks deep (so that it can't be affected by a reorg) and advances it
+    as the chain grows, so that each update only needs to query oxend for the blocks added since
+    the last one, plus the last few non-final blocks (and nothing at all while the top block stays
+    the same).  Starting from scratch, the totals up to the final height are first requested all at
+    once, as oxend keeps that sum cached; if that fails (e.g. because oxend can't sum the whole
+    chain within `config.emission_timeout`) we go through the chain in batches instead.
+
+    If `config.emission_db` is set (as it is, for each network, in mainnet.py etc.) the final
+    accumulator is stored there so that it survives restarts and is shared by all the processes
+    using the file: only one of them at a time (the one holding a lease stored alongside the
+    totals) advances the stored totals, while the others load them and add just the blocks past
+    them.
+
+    Failures (e.g. because oxend's RPC is restricted, and so doesn't allow the admin request this
+    needs) are retried with an increasing delay, up to `config.emission_max_backoff` seconds.
+
+    `get()` never waits on oxend: it returns the most recently computed totals, in the same form
+    as a get_coinbase_tx_sum response (plus the 'height' the totals go up to), or None if they
+    haven't been computed yet.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.final = None
+        self.current = None
+        self.db = None
+        self.owner = os.urandom(8).hex()
+        self.failures = 0
+        self.batched = False
+        self.top = None  # (height, top block hash) that `current` was computed for
+
+    def get(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    # Read when we start rather than when constructed, so that the per-network
+                    # config (e.g. mainnet.py), which gets loaded after us, can set it.
+                    self.path = config.emission_db
+                    self.thread = threading.Thread(target=self.run, name='emission-tally', daemon=True)
+                    self.thread.start()
+        return self.current
+
+    def _db(self):
+        # Only ever used from our own thread, so a single connection is fine
+        if self.db is not None:
+            return self.db
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS emission (
+                id INTEGER PRIMARY KEY CHECK(id = 0),
+                height INTEGER NOT NULL,
+                emission_amount INTEGER NOT NULL,
+                fee_amount INTEGER NOT NULL,
+                burn_amount INTEGER NOT NULL
+            )""")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS emission_lease (
+                id INTEGER PRIMARY KEY CHECK(id = 0),
+                owner TEXT NOT NULL,
+                expiry REAL NOT NULL
+            )""")
+        self.db = db
+        return db
+
+    def load(self):
+        totals = {'height': 0, 'emission_amount': 0, 'fee_amount': 0, 'burn_amount': 0}
+        if self.path:
+            try:
+                row = self._db().execute(
+                        "SELECT height, emission_amount, fee_amount, burn_amount FROM emission WHERE id = 0").fetchone()
+                if row is not None:
+                    totals = dict(zip(totals.keys(), row))
+            except sqlite3.Error as e:
+                print("Something getting wrong: unable to load emission totals: {}".format(e), file=sys.stderr)
+        return totals
+
+    def save(self, totals):
+        if not self.path:
+            return
+        try:
+            self._db().execute(
+                    "INSERT OR REPLACE INTO emission (id, height, emission_amount, fee_amount, burn_amount) VALUES (0, ?, ?, ?, ?)",
+                    (totals['height'], totals['emission_amount'], totals['fee_amount'], totals['burn_amount']))
+        except sqlite3.Error as e:
+            print("Something getting wrong: unable to store emission totals: {}".format(e), file=sys.stderr)
+
+    def lease(self):
+        """Takes, or renews, the lease on advancing the stored totals; returns True if we hold it.
+        Always True if the totals aren't stored."""
+        if not self.path:
+            return True
+        now = time.time()
+        # Long enough to cover a catch-up request, after which we renew it
+        expiry = now + 2 * config.emission_timeout + config.emission_poll_interval
+        try:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO emission_lease (id, owner, expiry) VALUES (0, '', 0)")
+            return db.execute("UPDATE emission_lease SET owner = ?, expiry = ? WHERE id = 0 AND (owner = ? OR expiry < ?)",
+                    (self.owner, expiry, self.owner, now)).rowcount == 1
+        except sqlite3.Error as e:
+            print("Something getting wrong: unable to update emission lease: {}".format(e), file=sys.stderr)
+            return False
+
+    @staticmethod
+    def add_blocks(omq, oxend, totals, count):
+        """Returns new totals including the `count` blocks following those included in `totals`"""
+        sums = FutureJSON(omq, oxend, 'admin.get_coinbase_tx_sum', None, timeout=config.emission_timeout,
+                fail_okay=True, args={"height": totals['height'], "count": count}).get()
+        if not sums or sums.get('status') != 'OK':
+            raise RuntimeError("unable to get coinbase sums for blocks {}-{}".format(
+                totals['height'], totals['height'] + count - 1))
+        return {
+            'height': totals['height'] + count,
+            **{k: totals[k] + sums[k] for k in ('emission_amount', 'fee_amount', 'burn_amount')},
+        }
+
+    def update(self):
+        omq, oxend = omq_connection()
+        info = FutureJSON(omq, oxend, 'rpc.get_info', 1).get()
+        if not info:
+            return
+        height = info['height']
+        final_height = max(0, height - config.finality_depth)
+        top = (height, info.get('top_block_hash'))
+        if self.current is not None and top == self.top:
+            # Nothing has changed since the last update
+            self.lease()
+            return
+
+        leader = self.lease()
+        if self.final is None or self.path:
+            # Another process may have advanced the stored totals
+            stored = self.load()
+            if self.final is None or stored['height'] > self.final['height']:
+                self.final = stored
+        if self.final['height'] > height:
+            # The chain is shorter than our supposedly final totals (e.g. we've been pointed at a
+            # different oxend), so we have to start over.
+            self.final = {'height': 0, 'emission_amount': 0, 'fee_amount': 0, 'burn_amount': 0}
+
+        if leader:
+            while self.final['height'] < final_height:
+                # oxend caches the sum over the whole chain, so from scratch a single request is
+                # much cheaper than going through the chain in batches, if oxend manages it in time.
+                whole = self.final['height'] == 0 and not self.batched
+                count = final_height if whole else min(
+                        config.emission_batch_blocks, final_height - self.final['height'])
+                try:
+                    self.final = self.add_blocks(omq, oxend, self.final, count)
+                except RuntimeError:
+                    if not whole:
+                        raise
+                    print("Something getting wrong: unable to sum the whole chain at once; summing it in batches instead",
+                            file=sys.stderr)
+                    self.batched = True
+                    continue
+                self.save(self.final)
+                self.lease()
+        elif final_height - self.final['height'] > config.emission_batch_blocks:
+            # The process holding the lease is still catching up; wait for it rather than repeating
+            # its work.
+            return
+
+        totals = self.final
+        if height > totals['height']:
+            totals = self.add_blocks(omq, oxend, totals, height - totals['height'])
+        self.current = {'status': 'OK', **totals}
+        self.top = top
+
+    def run(self):
+        while True:
+            try:
+                self.update()
+                self.failures = 0
+            except RuntimeError as e:
+                self.failures += 1
+                # Only report the first of a run of failures: on a restricted RPC they never stop
+                if self.failures == 1:
+                    print("Something getting wrong: emission update failed (retrying with backoff): {}".format(e), file=sys.stderr)
+            time.sleep(min(config.emission_poll_interval * 2**min(self.failures, 16), config.emission_max_backoff))
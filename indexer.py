@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# Local chain indexer: follows the chain via oxend and stores block headers and compact per-tx
+# summaries in a sqlite database (config.index_db) from which the observer can serve the index page
+# and block ranges without any oxend requests.
+#
+# Run it as a separate process alongside the observer, giving it the network module to load the
+# config from, e.g.:
+#
+#     python3 indexer.py mainnet
+
+import sqlite3
+import json
+import sys
+import time
+import threading
+import importlib
+import config
+from lmq import omq_connection
+
+
+def tx_summary(tx):
+    """Reduces a parsed tx (i.e. from parse_txs) to just the values needed to list it in a block:
+    hash, height, size, fee, input/output counts, coinbase flag, and the bits of `info` and
+    `extra` used to display the tx type symbol and fee."""
+    info = tx['info']
+    extra = tx.get('extra', {})
+    summary = {
+        'tx_hash': tx['tx_hash'],
+        'block_height': tx.get('block_height'),
+        'size': tx['size'],
+        'coinbase': 'vin' in info and len(info['vin']) == 1 and 'gen' in info['vin'][0],
+        'inputs': len(info.get('vin', [])),
+        'outputs': len(info.get('vout', [])),
+        'info': {'version': info['version'], 'type': info.get('type', 0)},
+        'extra': {k: extra[k] for k in ('sn_state_change', 'sn_pubkey', 'sn_registration', 'sn_contributor', 'burn_amount') if k in extra},
+    }
+    if 'rct_signatures' in info and 'txnFee' in info['rct_signatures']:
+        summary['info']['rct_signatures'] = {'txnFee': info['rct_signatures']['txnFee']}
+    if 'ons' in extra:
+        summary['extra']['ons'] = {k: extra['ons'][k] for k in ('buy', 'update') if k in extra['ons']}
+    return summary
+
+
+class ChainIndex():
+    """Access to the indexed blocks and tx summaries.  The observer opens this read-only; the
+    indexer process opens it read-write and is the only writer."""
+
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+        self.local = threading.local()
+        if not readonly:
+            db = self._db()
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS blocks (
+                    height INTEGER PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    header TEXT NOT NULL
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS txs (
+                    tx_hash TEXT NOT NULL,
+                    height INTEGER NOT NULL REFERENCES blocks(height) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    PRIMARY KEY(height, position)
+                ) WITHOUT ROWID""")
+            db.execute("CREATE INDEX IF NOT EXISTS txs_hash ON txs(tx_hash)")
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            if self.readonly:
+                db = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True, timeout=5, isolation_level=None)
+            else:
+                db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("PRAGMA foreign_keys=ON")
+            self.local.db = db
+        return db
+
+    def top(self):
+        """Returns (height, hash) of the highest indexed block, or None if the index is empty"""
+        return self._db().execute("SELECT height, hash FROM blocks ORDER BY height DESC LIMIT 1").fetchone()
+
+    def block_hash(self, height):
+        row = self._db().execute("SELECT hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row else None
+
+    def blocks(self, start_height, end_height):
+        """Returns the list of block headers from start_height to end_height (inclusive), each with
+        a 'txs' list of tx summaries (miner tx, if any, first).  Returns None if any of the blocks
+        in the range are not indexed (or if the index is unavailable)."""
+        try:
+            db = self._db()
+            blocks = [json.loads(h) for h, in db.execute(
+                "SELECT header FROM blocks WHERE height BETWEEN ? AND ? ORDER BY height", (start_height, end_height))]
+            if len(blocks) != end_height - start_height + 1:
+                return None
+            for b in blocks:
+                b['txs'] = []
+            for height, summary in db.execute(
+                    "SELECT height, summary FROM txs WHERE height BETWEEN ? AND ? ORDER BY height, position",
+                    (start_height, end_height)):
+                blocks[height - start_height]['txs'].append(json.loads(summary))
+        except sqlite3.Error as e:
+            print("Something getting wrong: chain index lookup failed: {}".format(e), file=sys.stderr)
+            return None
+        return blocks
+
+    def add_blocks(self, blocks):
+        """Adds blocks (each a header with a 'txs' list of tx summaries) to the index"""
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            for b in blocks:
+                txs = b.pop('txs')
+                db.execute("INSERT INTO blocks (height, hash, header) VALUES (?, ?, ?)",
+                        (b['height'], b['hash'], json.dumps(b, separators=(',', ':'))))
+                db.executemany("INSERT INTO txs (tx_hash, height, position, summary) VALUES (?, ?, ?, ?)",
+                        ((tx['tx_hash'], b['height'], i, json.dumps(tx, separators=(',', ':'))) for i, tx in enumerate(txs)))
+
+    def rollback(self, height):
+        """Removes all indexed blocks (and their txs) at or above `height`"""
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            db.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+
+
+class Indexer():
+    """Follows the chain, adding new blocks to the index as they arrive and rolling back any
+    indexed blocks that get replaced by a reorg."""
+
+    def __init__(self, index):
+        self.index = index
+        self.omq, self.oxend = omq_connection()
+
+    def request(self, endpoint, args=None, timeout=30):
+        result = self.omq.request_future(self.oxend, endpoint, [] if args is None else [json.dumps(args).encode()],
+                timeout=timeout).get()
+        if result[0] != b'200':
+            raise RuntimeError("Request for {} failed: got {}".format(endpoint, result))
+        return json.loads(result[1])
+
+    def fetch_blocks(self, start_height, end_height):
+        headers = self.request('rpc.get_block_headers_range',
+                {'start_height': start_height, 'end_height': end_height, 'get_tx_hashes': True})['headers']
+        txids = []
+        for h in headers:
+            h.pop('depth', None)  # Changes with every block, so don't store it
+            if h.get('miner_tx_hash'):
+                txids.append(h['miner_tx_hash'])
+            txids += h.get('tx_hashes', [])
+            h['txs'] = []
+
+        by_height = {h['height']: h for h in headers}
+        if txids:
+            txs = self.request('rpc.get_transactions', {
+                'txs_hashes': txids, 'decode_as_json': True, 'tx_extra': True, 'prune': True, 'stake_info': True})
+            if txs.get('missed_tx') or len(txs.get('txs', [])) != len(txids):
+                raise RuntimeError("Unable to retrieve all txs for blocks {}-{}".format(start_height, end_height))
+            for tx in txs['txs']:
+                tx['info'] = json.loads(tx['as_json'])
+                by_height[tx['block_height']]['txs'].append(tx_summary(tx))
+        return headers
+
+    def find_fork(self, top_height):
+        """Walks back from our top indexed block to find the first height at which our index
+        disagrees with oxend"""
+        height = top_height
+        while height >= 0:
+            start = max(0, height - 99)
+            headers = self.request('rpc.get_block_headers_range', {'start_height': start, 'end_height': height})['headers']
+            for h in reversed(headers):
+                if self.index.block_hash(h['height']) == h['hash']:
+                    return h['height'] + 1
+            height = start - 1
+        return 0
+
+    def sync(self):
+        """Indexes up to config.index_batch_size new blocks; returns True if there are more to do"""
+        chain_height = self.request('rpc.get_info')['height']
+        top = self.index.top()
+        if top is None:
+            next_height = max(0, chain_height - config.index_initial_blocks)
+        else:
+            next_height = top[0] + 1
+
+        if next_height >= chain_height:
+            # Nothing new, but make sure our top block hasn't been replaced (or, if the chain
+            # shrank, popped) by a reorg:
+            if top is not None and (top[0] >= chain_height or self.request('rpc.get_block_header_by_height',
+                    {'height': top[0]})['block_header']['hash'] != top[1]):
+                self.reorg(top[0])
+                return True
+            return False
+
+        end_height = min(chain_height - 1, next_height + config.index_batch_size - 1)
+        blocks = self.fetch_blocks(next_height, end_height)
+        if top is not None and blocks[0]['prev_hash'] != top[1]:
+            self.reorg(top[0])
+            return True
+        self.index.add_blocks(blocks)
+        return end_height < chain_height - 1
+
+    def reorg(self, top_height):
+        fork = self.find_fork(min(top_height, self.request('rpc.get_info')['height'] - 1))
+        print("Reorg detected; rolling back index to height {}".format(fork), file=sys.stderr)
+        self.index.rollback(fork)
+
+    def run(self):
+        while True:
+            try:
+                more = self.sync()
+            except (RuntimeError, KeyError, sqlite3.Error) as e:
+                print("Something getting wrong: indexing failed: {}".format(e), file=sys.stderr)
+                more = False
+            if not more:
+                time.sleep(config.index_poll_interval)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: {} NETWORK   -- where NETWORK is mainnet, testnet, devnet, etc.".format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+    # Load the network's module for its config settings (e.g. the oxend RPC address)
+    importlib.import_module(sys.argv[1])
+    if not config.index_db:
+        print("config.index_db is not set; nothing to do", file=sys.stderr)
+        sys.exit(1)
+    Indexer(ChainIndex(config.index_db, readonly=False)).run()
@@ -0,0 +1,96 @@
+import json
+import queue
+import sys
+import threading
+import time
+import config
+
+
+class LiveFeed():
+    """Shared producer of live chain updates for server-sent-event subscribers (see the /events
+    route).  A single background thread per process polls the (cached) chain state while anyone is
+    subscribed, works out what changed, and pushes small JSON events to every subscriber:
+
+    - `height` -- {height} when the chain height changes
+    - `block` -- one for each new block, as returned by `get_blocks`
+    - `mempool` -- {added: [...], removed: [txid, ...], count, size} when the mempool changes
+
+    poll - function returning (height, mempool) where mempool is a dict of txid => tx summary
+    get_blocks - function taking a start and end height and returning a list of block summaries
+    """
+
+    def __init__(self, poll, get_blocks):
+        self.poll = poll
+        self.get_blocks = get_blocks
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.active = threading.Condition(self.lock)
+        self.thread = None
+        self.height = None
+        self.mempool = None
+
+    def subscribe(self):
+        """Returns a new subscriber queue from which serialized events can be read"""
+        q = queue.Queue(maxsize=config.live_queue_size)
+        with self.lock:
+            self.subscribers.add(q)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='live-feed', daemon=True)
+                self.thread.start()
+            self.active.notify()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def subscribed(self, q):
+        return q in self.subscribers
+
+    def publish(self, events):
+        """Sends a list of (event, data) pairs to all subscribers.  Each event is serialized once
+        and shared by all subscribers; subscribers that aren't keeping up are dropped."""
+        msgs = ['event: {}\ndata: {}\n\n'.format(ev, json.dumps(data, separators=(',', ':'))) for ev, data in events]
+        with self.lock:
+            for q in list(self.subscribers):
+                try:
+                    for m in msgs:
+                        q.put_nowait(m)
+                except queue.Full:
+                    self.subscribers.discard(q)
+
+    def update(self):
+        height, mempool = self.poll()
+        events = []
+        if self.height is not None and height != self.height:
+            events.append(('height', {'height': height}))
+            if height > self.height:
+                # Only send the most recent few blocks if we somehow fell far behind
+                start = max(self.height, height - config.max_blocks_per_page)
+                events += [('block', b) for b in self.get_blocks(start, height - 1)]
+        if self.mempool is not None:
+            added = [tx for txid, tx in mempool.items() if txid not in self.mempool]
+            removed = [txid for txid in self.mempool if txid not in mempool]
+            if added or removed:
+                events.append(('mempool', {
+                    'added': added,
+                    'removed': removed,
+                    'count': len(mempool),
+                    'size': sum(tx['size'] for tx in mempool.values()),
+                    }))
+        self.height, self.mempool = height, mempool
+        if events:
+            self.publish(events)
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.subscribers:
+                    # Forget the state so that we don't send a huge delta when someone subscribes again
+                    self.height, self.mempool = None, None
+                    self.active.wait()
+            try:
+                self.update()
+            except Exception as e:
+                print("Something getting wrong: live feed update failed: {}".format(e), file=sys.stderr)
+            time.sleep(config.live_poll_interval)
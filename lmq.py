@@ -2,79 +2,591 @@ import oxenmq
 import config
 import json
 import sys
-from datetime import datetime, timedelta
+import math
+import time
+import hashlib
+import threading
+from persist import PersistentCache
+from collections import OrderedDict
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
 
 omq, oxend = None, None
+connection_lock = threading.Lock()
 def omq_connection():
     global omq, oxend
-    if omq is None:
-        omq = oxenmq.OxenMQ(log_level=oxenmq.LogLevel.warn)
-        omq.max_message_size = 200*1024*1024
-        omq.start()
-    if oxend is None:
-        oxend = omq.connect_remote(config.oxend_rpc)
+    if oxend is not None:
+        return (omq, oxend)
+    with connection_lock:
+        # Another thread may have connected while we waited for the lock
+        if oxend is not None:
+            return (omq, oxend)
+        if omq is None:
+            o = oxenmq.OxenMQ(log_level=oxenmq.LogLevel.warn)
+            o.max_message_size = 200*1024*1024
+            if config.notifications:
+                notify = o.add_category("notify", oxenmq.AuthLevel.none)
+                notify.add_command("block", on_block_notify)
+                notify.add_command("mempool", on_mempool_notify)
+            o.start()
+            omq = o
+        conn = omq.connect_remote(config.oxend_rpc)
+        if config.notifications:
+            threading.Thread(target=subscribe_notifications, args=(omq, conn), name='oxend-subscriber', daemon=True).start()
+        # Only published once fully set up, so that the unlocked check above never sees a
+        # half-initialized connection:
+        oxend = conn
     return (omq, oxend)
 
-cached = {}
-cached_args = {}
-cache_expiry = {}
+
+# Endpoints whose cached results become outdated when oxend tells us about a new block and/or a new
+# mempool transaction.
+notify_tags = {
+    'rpc.get_info': ('block', 'mempool'),
+    'rpc.get_transaction_pool': ('block', 'mempool'),
+    'rpc.get_transaction_pool_hashes': ('block', 'mempool'),
+    'rpc.get_service_nodes': ('block',),
+    'rpc.get_staking_requirement': ('block',),
+    'rpc.get_fee_estimate': ('block',),
+    'rpc.hard_fork_info': ('block',),
+    'rpc.get_accrued_batched_earnings': ('block',),
+    'rpc.get_checkpoints': ('block',),
+    'rpc.get_quorum_state': ('block',),
+    'rpc.ons_names_to_owners': ('block',),
+}
+
+# When we last got each type of notification; cached values of endpoints with that tag stored
+# before this time are no longer fresh.
+notified = {'block': 0, 'mempool': 0}
+# Until when our notification subscriptions are known to be active:
+notify_active_until = 0
+
+def notifications_active():
+    return notify_active_until >= time.time()
+
+def invalidated_since(endpoint):
+    """Returns the time of the most recent notification affecting `endpoint`'s results"""
+    return max((notified[t] for t in notify_tags.get(endpoint, ())), default=0)
+
+def on_block_notify(msg):
+    global chain_height
+    notified['block'] = time.time()
+    try:
+        chain_height = int(msg.data()[0]) + 1
+    except (IndexError, ValueError):
+        pass
+    refresher.invalidate('block')
+
+def on_mempool_notify(msg):
+    notified['mempool'] = time.time()
+    refresher.invalidate('mempool')
+
+def subscribe_notifications(omq, oxend):
+    """Keeps our block and mempool notification subscriptions with oxend alive; oxend expires
+    subscriptions that aren't renewed after a minute or so."""
+    global notify_active_until
+    while True:
+        try:
+            ok = True
+            for endpoint, args in (('sub.block', []), ('sub.mempool', [b'all'])):
+                result = omq.request_future(oxend, endpoint, args, timeout=5).get()
+                if not result or result[0] not in (b'OK', b'ALREADY'):
+                    ok = False
+                    print("Something getting wrong: {} subscription failed: {}".format(endpoint, result), file=sys.stderr)
+            if ok:
+                notify_active_until = time.time() + 50
+        except RuntimeError as e:
+            print("Something getting wrong: notification subscription failed: {}".format(e), file=sys.stderr)
+        time.sleep(30)
+
+
+class LRUCache():
+    """In-process LRU cache of RPC responses.  Each entry is keyed by the (endpoint, cache_key,
+    args) of the request and has its own expiry time.  When the cache holds more than
+    `max_entries` entries, or more than `max_bytes` bytes of (raw, unparsed) responses, the least
+    recently used entries are evicted.
+
+    An entry can also be given a "stale" lifetime beyond its expiry during which it is only
+    returned to callers that ask for stale values (see `Refresher`); entries stored before the
+    `newer_than` time given to get() (i.e. before a notification that invalidates them) are
+    treated the same as expired entries.  Expired entries are dropped
+    when looked up after their stale lifetime, or when evicted to make room.  Hit, stale hit,
+    miss, expiry and eviction counts are kept in `stats`.
+
+    The cache can be used from any number of threads; see `StripedCache` for spreading heavily
+    used caches over several locks.  Cached values are shared by everyone who looks them up, so
+    must not be modified.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.data = OrderedDict()  # key => (expiry, stale_expiry, stored, size, value)
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    def get(self, key, stale=False, newer_than=0):
+        """Returns the cached, parsed value for `key` if present, not yet expired, and stored after
+        `newer_than` (or, if `stale` is True, not yet past its stale lifetime); otherwise returns
+        None."""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            now = time.time()
+            if entry[0] < now or entry[2] < newer_than:
+                if stale and entry[1] >= now:
+                    self.data.move_to_end(key)
+                    self.stats['stale'] += 1
+                    return entry[4]
+                if entry[1] < now:
+                    self._remove(key)
+                    self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.data.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[4]
+
+    def set(self, key, value, raw, cache_seconds, stale_seconds=0):
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            now = time.time()
+            expiry = now + cache_seconds
+            self.data[key] = (expiry, expiry + stale_seconds, now, size, value)
+            self.size += size
+            while len(self.data) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.data)))
+                self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        self.size -= self.data.pop(key)[3]
+
+
+class StripedCache():
+    """An LRUCache split into `stripes` independent LRUCaches (each with its share of the entry and
+    byte limits), with each key always going to the same stripe.  Lookups of different keys thus
+    (usually) take different locks, so threads don't all queue up behind a single cache lock.
+    Least recently used entries are evicted per stripe rather than across the whole cache.
+    """
+
+    def __init__(self, stripes, max_entries, max_bytes):
+        self.stripes = [LRUCache(math.ceil(max_entries / stripes), max_bytes // stripes) for _ in range(stripes)]
+
+    def stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def get(self, key, stale=False, newer_than=0):
+        return self.stripe(key).get(key, stale, newer_than)
+
+    def set(self, key, value, raw, cache_seconds, stale_seconds=0):
+        self.stripe(key).set(key, value, raw, cache_seconds, stale_seconds)
+
+    @property
+    def size(self):
+        return sum(s.size for s in self.stripes)
+
+    @property
+    def stats(self):
+        stats = {}
+        for s in self.stripes:
+            for k, v in s.stats.items():
+                stats[k] = stats.get(k, 0) + v
+        return stats
+
+
+class UwsgiCache():
+    """RPC response cache stored in a uwsgi cache (see the `cache2` uwsgi option) so that a single
+    cached response is shared by all the uwsgi worker processes on the host.
+
+    Values are stored as the raw JSON response prefixed with the storage and expiry times and are re-parsed on
+    each hit, so the per-worker memory use does not grow with the size or number of cached
+    responses.  uwsgi keys are length-limited, so the request args are hashed into the key.  Size
+    limits and eviction are handled by uwsgi (according to the `cache2` options); hits and misses
+    seen by this worker are counted in `stats`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0}
+
+    @staticmethod
+    def _key(key):
+        endpoint, cache_key, args = key
+        return '{}/{}/{}'.format(endpoint, cache_key,
+                hashlib.blake2b(args, digest_size=16).hexdigest() if args is not None else '')
+
+    def get(self, key, stale=False, newer_than=0):
+        raw = uwsgi.cache_get(self._key(key), self.name)
+        if raw is not None:
+            try:
+                stored, expiry, stale_expiry, raw = raw.split(b'\n', 3)
+                now = time.time()
+                fresh = float(expiry) >= now and float(stored) >= newer_than
+                if fresh or (stale and float(stale_expiry) >= now):
+                    value = json.loads(raw)
+                    self.stats['hits' if fresh else 'stale'] += 1
+                    return value
+            except ValueError:
+                pass
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value, raw, cache_seconds, stale_seconds=0):
+        now = time.time()
+        expiry = now + cache_seconds
+        # This silently does nothing if the value is too large for the configured cache blocks.
+        uwsgi.cache_update(self._key(key), b'%.3f\n%.3f\n%.3f\n%s' % (now, expiry, expiry + stale_seconds, raw),
+                math.ceil(cache_seconds + stale_seconds), self.name)
+
+
+def make_cache():
+    if config.uwsgi_cache is not None and uwsgi is not None:
+        return UwsgiCache(config.uwsgi_cache)
+    if config.cache_stripes > 1:
+        return StripedCache(config.cache_stripes, config.cache_max_entries, config.cache_max_bytes)
+    return LRUCache(config.cache_max_entries, config.cache_max_bytes)
+
+cache = None
+cache_lock = threading.Lock()
+def get_cache():
+    global cache
+    if cache is None:
+        with cache_lock:
+            if cache is None:
+                cache = make_cache()
+    return cache
+
+persistent_cache = None
+def get_persistent_cache():
+    """Returns the on-disk cache of final responses, or None if disabled (config.persistent_cache)"""
+    global persistent_cache
+    if persistent_cache is None and config.persistent_cache:
+        with cache_lock:
+            if persistent_cache is None:
+                persistent_cache = PersistentCache(config.persistent_cache)
+    return persistent_cache
+
+# The most recent chain height we have seen in a get_info response (whether from oxend or the
+# cache) or block notification; used to decide when a response is old enough to be stored in the
+# persistent cache.
+chain_height = 0
+def update_chain_height(info):
+    global chain_height
+    if info and 'height' in info:
+        chain_height = info['height']
+
+def height_is_final(height):
+    """Returns True if `height` is at least `config.finality_depth` blocks below the most recently
+    seen chain height"""
+    return height is not None and height + config.finality_depth <= chain_height
+
+
+class SharedRequest():
+    """An oxend request that any number of FutureJSON instances (possibly in different threads) can
+    wait on.  The reply is dealt with as soon as it arrives (in an OxenMQ thread, via the request
+    callback): it is parsed, stored in the cache, and then handed out to everyone waiting on the
+    request.
+
+    Use `SharedRequest.start(...)` to get the existing in-flight request for the same endpoint,
+    cache key, and args, or to start a new one if there isn't one.  A request can be joined for as
+    long as its reply hasn't arrived, however long oxend takes to send it (once it has, the result
+    is in the cache instead); uncached requests are never coalesced.
+    """
+
+    def __init__(self, omq, oxend, key, cache_seconds, timeout, stale_seconds=0, final_height=None):
+        self.key = key
+        self.endpoint, _, args = key
+        self.cache_seconds = cache_seconds
+        self.stale_seconds = stale_seconds
+        self.final_height = final_height
+        self.done = threading.Event()
+        self.json = None
+        self.error = None
+        # (event loop, asyncio future) of everyone awaiting the reply from asyncio code:
+        self.waiters = []
+        self.waiters_lock = threading.Lock()
+        omq.request(oxend, self.endpoint, self.on_reply, [] if args is None else [args], timeout=timeout)
+
+    @staticmethod
+    def start(omq, oxend, key, cache_seconds, timeout, stale_seconds=0, final_height=None):
+        if cache_seconds is None:
+            return SharedRequest(omq, oxend, key, cache_seconds, timeout, final_height=final_height)
+
+        with inflight_lock:
+            req = inflight.get(key)
+            if req is None or not req.joinable():
+                req = SharedRequest(omq, oxend, key, cache_seconds, timeout, stale_seconds, final_height)
+                inflight[key] = req
+            return req
+
+    def joinable(self):
+        return not self.done.is_set()
+
+    def on_reply(self, success, data):
+        """Called, from an OxenMQ thread, with the reply (or failure) of the request"""
+        try:
+            if not success or len(data) < 2 or data[0] != b'200':
+                raise RuntimeError("Request for {} failed: got {}".format(self.endpoint, data))
+            try:
+                self.json = json.loads(data[1])
+            except ValueError as e:
+                raise RuntimeError("Request for {} returned invalid JSON: {}".format(self.endpoint, e))
+            if self.endpoint == 'rpc.get_info':
+                # Done here, rather than by whoever collects the reply, so that replies that only
+                # go into the cache (e.g. background refreshes) count too.
+                update_chain_height(self.json)
+            if self.cache_seconds is not None:
+                get_cache().set(self.key, self.json, data[1], self.cache_seconds, self.stale_seconds)
+            if self.final_height is not None and get_persistent_cache():
+                height = self.final_height(self.json)
+                if height_is_final(height):
+                    get_persistent_cache().set(self.endpoint, self.key[2], height, data[1])
+        except RuntimeError as e:
+            self.json = None
+            self.error = e
+        finally:
+            with inflight_lock:
+                if inflight.get(self.key) is self:
+                    del inflight[self.key]
+            with self.waiters_lock:
+                self.done.set()
+                waiters, self.waiters = self.waiters, []
+            for loop, waiter in waiters:
+                try:
+                    loop.call_soon_threadsafe(wake, waiter)
+                except RuntimeError:
+                    pass  # The loop has been closed
+
+    def get(self):
+        """Waits for and returns the parsed reply; raises a RuntimeError if the request failed.
+        (OxenMQ always calls back, with a failure if need be, once the request times out.)"""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.json
+
+    async def aget(self):
+        """Awaitable version of get(), for use from asyncio code (see asgi.py).  Nothing blocks
+        waiting for the reply: the awaiting task is woken up, on its own event loop, from the reply
+        callback."""
+        import asyncio
+        with self.waiters_lock:
+            if self.done.is_set():
+                waiter = None
+            else:
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self.waiters.append((loop, waiter))
+        if waiter is not None:
+            await waiter
+        return self.get()
+
+def wake(waiter):
+    if not waiter.done():  # i.e. unless the awaiting task has been cancelled
+        waiter.set_result(None)
+
+inflight = {}
+inflight_lock = threading.Lock()
+
+
+class Refresher():
+    """Background thread that keeps hot requests refreshed ahead of their expiry so that request
+    handlers can always be answered from memory.
+
+    A request is hot if its endpoint is listed in `config.refresh_endpoints` and it uses the
+    default (empty) cache_key; FutureJSON registers each such request here (with its arguments)
+    when it is used.  Hot requests are cached with a stale lifetime of
+    `config.refresh_max_stale` seconds: if a refresh is still running when the cached value
+    expires then the previous value keeps being served until the refresh completes.  Hot requests
+    that haven't been used for `config.refresh_idle` seconds are no longer refreshed.
+
+    Note that when running under uwsgi this requires `enable-threads = true`.
+    """
+
+    def __init__(self):
+        self.hot = {}  # key => [cache_seconds, timeout, last_used, next_refresh]
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+
+    @staticmethod
+    def is_hot(endpoint, cache_seconds, cache_key):
+        return cache_seconds is not None and not cache_key and endpoint in config.refresh_endpoints
+
+    def touch(self, key, cache_seconds, timeout):
+        """Marks a hot request as used, registering it if it is new."""
+        now = time.time()
+        with self.lock:
+            h = self.hot.get(key)
+            if h is None:
+                self.hot[key] = [cache_seconds, timeout, now, now + self.refresh_interval(cache_seconds)]
+                self.wakeup.notify()
+            else:
+                h[0] = cache_seconds
+                h[2] = now
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='rpc-refresher', daemon=True)
+                self.thread.start()
+
+    def invalidate(self, tag):
+        """Refreshes any hot requests affected by a `tag` ('block' or 'mempool') notification right
+        away rather than waiting for their scheduled refresh."""
+        with self.lock:
+            refresh = False
+            for k, h in self.hot.items():
+                if tag in notify_tags.get(k[0], ()):
+                    h[3] = 0
+                    refresh = True
+            if refresh:
+                self.wakeup.notify()
+
+    @staticmethod
+    def refresh_interval(cache_seconds):
+        # Refresh somewhat before expiry so that the new value is in place by the time the old one
+        # expires:
+        return cache_seconds * 0.8
+
+    def run(self):
+        omq, oxend = omq_connection()
+        while True:
+            with self.lock:
+                now = time.time()
+                for k in [k for k, h in self.hot.items() if h[2] + config.refresh_idle < now]:
+                    del self.hot[k]
+                due = [(k, h[0], h[1]) for k, h in self.hot.items() if h[3] <= now]
+                if not due:
+                    next_refresh = min((h[3] for h in self.hot.values()), default=now + config.refresh_idle)
+                    self.wakeup.wait(next_refresh - now)
+                    continue
+                for k, _, _ in due:
+                    self.hot[k][3] = now + 1  # Retry in a second if the refresh fails
+
+            requests = [(k, cache_seconds, SharedRequest.start(omq, oxend, k, cache_seconds, timeout, config.refresh_max_stale))
+                    for k, cache_seconds, timeout in due]
+            for k, cache_seconds, req in requests:
+                try:
+                    req.get()
+                except RuntimeError as e:
+                    print("Something getting wrong: background refresh failed: {}".format(e), file=sys.stderr)
+                    continue
+                with self.lock:
+                    if k in self.hot:
+                        self.hot[k][3] = time.time() + self.refresh_interval(cache_seconds)
+
+refresher = Refresher()
+
 
 class FutureJSON():
     """Class for making a LMQ JSON RPC request that uses a future to wait on the result, and caches
     the results for a set amount of time so that if the same endpoint with the same arguments is
-    requested again the cache will be used instead of repeating the request.
+    requested again the cache will be used instead of repeating the request.  If an identical
+    request is already in flight (from this or another thread) the new instance waits on that
+    request rather than sending another one to oxend.
+
+    Cached values are indexed by endpoint, optional key, and the request arguments, so requests
+    for different arguments (e.g. different blocks) each get their own cache entry.  The cache is
+    bounded (see `config.cache_max_entries` and `config.cache_max_bytes`) and evicts the least
+    recently used entries when full.
+
+    The cache is per-process unless `config.uwsgi_cache` names a uwsgi cache, in which case it is
+    shared by all uwsgi workers.
+
+    Requests for the endpoints in `config.refresh_endpoints` are kept refreshed in the background
+    (see `Refresher`) and may be answered with the previous value while a refresh is running.
+
+    If `config.notifications` is enabled we subscribe to oxend's block and mempool notifications,
+    and cached results of the endpoints in `notify_tags` are invalidated as soon as the chain or
+    mempool changes.  While the subscription is active their cache lifetimes are extended to at
+    least `config.notify_fallback_ttl`, since the expiry is then only a fallback.
+
+    Requests given a `final_height` function are looked up in (and, once final, stored in) the
+    persistent on-disk cache, if enabled via `config.persistent_cache`.
 
-    Cached values are indexed by endpoint and optional key, and require matching arguments to the
-    previous call.  The cache_key should generally be a fixed value (*not* an argument-dependent
-    value) and can be used to provide multiple caches for different uses of the same endpoint.
-    Cache entries are *not* purged, they are only replaced, so using dynamic data in the key would
-    result in unbounded memory growth.
+    The parsed results are shared (through the cache and with other threads waiting on the same
+    request) so must be treated as read-only: anything derived from them has to be built as a new
+    object rather than added to the result.
+
+    From asyncio code the result can be awaited (`await FutureJSON(...)`) rather than calling
+    `get()`, which would block the event loop.
 
     omq - the omq object
     oxend - the oxend omq connection id object
     endpoint - the omq endpoint, e.g. 'rpc.get_info'
     cache_seconds - how long to cache the response; can be None to not cache it at all
-    cache_key - fixed string to enable different caches of the same endpoint
+    cache_key - fixed string to keep different uses of the same endpoint in separate cache entries
     args - if not None, a value to pass (after converting to JSON) as the request parameter. Typically a dict.
     fail_okay - can be specified as True to make failures silent (i.e. if failures are sometimes expected for this request)
     timeout - maximum time to spend waiting for a reply
+    final_height - if given, a function that takes the parsed response and returns the block
+        height that the response is tied to, or None if the response is not tied to a block (e.g.
+        because it includes mempool transactions).  Responses tied to a height at least
+        `config.finality_depth` blocks deep are stored in the persistent cache.
     """
 
-    def __init__(self, omq, oxend, endpoint, cache_seconds=3, *, cache_key='', args=None, fail_okay=False, timeout=10):
+    def __init__(self, omq, oxend, endpoint, cache_seconds=3, *, cache_key='', args=None, fail_okay=False, timeout=10,
+            final_height=None):
         self.endpoint = endpoint
-        self.cache_key = self.endpoint + cache_key
         self.fail_okay = fail_okay
         if args is not None:
             args = json.dumps(args).encode()
-        if self.cache_key in cached and cached_args[self.cache_key] == args and cache_expiry[self.cache_key] >= datetime.now():
-            self.json = cached[self.cache_key]
-            self.args = None
-            self.future = None
-        else:
-            self.json = None
-            self.args = args
-            self.future = omq.request_future(oxend, self.endpoint, [] if self.args is None else [self.args], timeout=timeout)
-        self.cache_seconds = cache_seconds
+        key = (endpoint, cache_key, args)
+        if cache_seconds is not None and endpoint in notify_tags and notifications_active():
+            # oxend tells us when these change, so we don't need to expire them so quickly
+            cache_seconds = max(cache_seconds, config.notify_fallback_ttl)
+        hot = Refresher.is_hot(endpoint, cache_seconds, cache_key)
+        self.json = get_cache().get(key, stale=hot, newer_than=invalidated_since(endpoint))
+        self.request = None
+        if self.json is None and final_height is not None and get_persistent_cache():
+            raw = get_persistent_cache().get(endpoint, args)
+            if raw is not None:
+                self.json = json.loads(raw)
+                if cache_seconds is not None:
+                    get_cache().set(key, self.json, raw, cache_seconds)
+        if self.json is None:
+            self.request = SharedRequest.start(omq, oxend, key, cache_seconds, timeout,
+                    config.refresh_max_stale if hot else 0, final_height)
+        elif endpoint == 'rpc.get_info':
+            update_chain_height(self.json)
+        if hot:
+            refresher.touch(key, cache_seconds, timeout)
 
     def get(self):
         """If the result is already available, returns it immediately (and can safely be called multiple times.
         Otherwise waits for the result, parses as json, and caches it.  Returns None if the request fails"""
-        if self.json is None and self.future is not None:
+        if self.json is None and self.request is not None:
             try:
-                result = self.future.get()
-                self.future = None
-                if result[0] != b'200':
-                    raise RuntimeError("Request for {} failed: got {}".format(self.endpoint, result))
-                self.json = json.loads(result[1])
-                if self.cache_seconds is not None:
-                    cached[self.cache_key] = self.json
-                    cached_args[self.cache_key] = self.args
-                    cache_expiry[self.cache_key] = datetime.now() + timedelta(seconds=self.cache_seconds)
+                self.json = self.request.get()
             except RuntimeError as e:
                 if not self.fail_okay:
                     print("Something getting wrong: {}".format(e), file=sys.stderr)
-                self.future = None
+            self.request = None
 
         return self.json
 
+    async def aget(self):
+        """Awaitable version of get(): returns the result without blocking the event loop"""
+        if self.json is None and self.request is not None:
+            request = self.request
+            try:
+                self.json = await request.aget()
+            except RuntimeError as e:
+                if not self.fail_okay:
+                    print("Something getting wrong: {}".format(e), file=sys.stderr)
+            self.request = None
+
+        return self.json
+
+    def __await__(self):
+        return self.aget().__await__()
+
 
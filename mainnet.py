@@ -2,3 +2,5 @@ from observer import app, config
 import oxenmq
 
 config.oxend_rpc = oxenmq.Address('ipc://oxend/mainnet.sock')
+config.emission_db = 'mainnet-emission.db'
+config.sn_changes_db = 'mainnet-sn-changes.db'
@@ -1,44 +1,75 @@
 #!/usr/bin/env python3
 
 import flask
+import jinja2
 from datetime import datetime, timedelta, timezone
-import babel.dates
 import json
 import sys
 import statistics
 import string
-import requests
-import time
 import base64
+import hashlib
+from html import escape as escape_html
+import functools
+import queue
+import threading
 from base64 import b32encode, b16decode
 from werkzeug.routing import BaseConverter
-from pygments import highlight
-from pygments.lexers import JsonLexer
-from pygments.formatters import HtmlFormatter
-import subprocess
-import qrcode
 from io import BytesIO
-import pysodium
-import nacl.encoding
-import nacl.hash
+import os
 import base58
-from Cryptodome.Hash import keccak
 import config
 import local_config
-from lmq import FutureJSON, omq_connection
+from lmq import FutureJSON, omq_connection, LRUCache
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+from indexer import ChainIndex, tx_summary
+from live import LiveFeed
+from txpool import MempoolTracker, mempool_page, sort_orders as mempool_sort_orders
+from snregistry import SNRegistry, sort_orders as sn_sort_orders
+from emission import EmissionTally
+from prices import PriceTicker
 
 # Make a dict of config.* to pass to templating
 conf = {x: getattr(config, x) for x in dir(config) if not x.startswith('__')}
 
-git_rev = subprocess.run(["git", "rev-parse", "--short=9", "HEAD"], stdout=subprocess.PIPE, text=True)
-if git_rev.returncode == 0:
-    git_rev = git_rev.stdout.strip()
-else:
-    git_rev = "(unknown)"
+def git_revision(path=os.path.dirname(os.path.abspath(__file__))):
+    """Returns the short hash of the git commit checked out at `path`, read directly from the .git
+    directory (rather than running git, which is slow to start)."""
+    try:
+        gitdir = os.path.join(path, '.git')
+        if os.path.isfile(gitdir):
+            # A worktree or submodule, with a `gitdir: ...` pointer to the real git dir
+            with open(gitdir) as f:
+                gitdir = os.path.join(path, f.read().strip().partition('gitdir:')[2].strip())
+        with open(os.path.join(gitdir, 'HEAD')) as f:
+            head = f.read().strip()
+        if head.startswith('ref:'):
+            ref = head[4:].strip()
+            commondir = gitdir
+            if os.path.isfile(os.path.join(gitdir, 'commondir')):
+                with open(os.path.join(gitdir, 'commondir')) as f:
+                    commondir = os.path.join(gitdir, f.read().strip())
+            try:
+                with open(os.path.join(commondir, ref)) as f:
+                    head = f.read().strip()
+            except FileNotFoundError:
+                with open(os.path.join(commondir, 'packed-refs')) as f:
+                    head = next(line.split()[0] for line in f if line.rstrip().endswith(' ' + ref))
+        return head[:9]
+    except (OSError, StopIteration):
+        return "(unknown)"
+
+git_rev = git_revision()
 
 app = flask.Flask(__name__)
 
 app.jinja_options['extensions'] = ['jinja2.ext.loopcontrols']
+if config.template_cache:
+    app.jinja_options['bytecode_cache'] = jinja2.FileSystemBytecodeCache(
+            *([] if config.template_cache is True else [config.template_cache]))
 
 class Hex64Converter(BaseConverter):
     def __init__(self, url_map):
@@ -50,6 +81,7 @@ app.url_map.converters['hex64'] = Hex64Converter
 
 @app.template_filter('format_datetime')
 def format_datetime(value, format='long'):
+    import babel.dates
     return babel.dates.format_datetime(value, format, tzinfo=babel.dates.get_timezone('UTC'))
 
 @app.template_filter('from_timestamp')
@@ -165,6 +197,7 @@ def ellipsize(string, leading=10, trailing=5, ellipsis='...'):
 
 @app.after_request
 def add_global_headers(response):
+    # Routes with their own cache policy (see below) set their own Cache-Control header:
     for k, v in {
             'Cache-Control': 'no-store',
             'Access-Control-Allow-Origin': '*',
@@ -173,6 +206,50 @@ def add_global_headers(response):
             response.headers[k] = v
     return response
 
+
+def live_cache_policy(f):
+    """Route decorator for live pages (e.g. the index) that allows browsers and proxies to cache
+    the page for a short time (`config.live_max_age`)."""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        r = flask.make_response(f(*args, **kwargs))
+        if r.status_code == 200 and config.live_max_age:
+            r.headers['Cache-Control'] = 'public, max-age={}'.format(config.live_max_age)
+        return r
+    return wrapper
+
+
+def final_etag(*parts):
+    """Returns the (weak) ETag value for a page that depends only on final chain data (i.e. a block
+    or tx that is at least config.finality_depth blocks deep), identified by `parts`.  Such pages
+    only change when the observer code does, so the code revision is included."""
+    return '-'.join(str(p) for p in (*parts, git_rev))
+
+
+def not_modified(etag):
+    """Returns a 304 response if the request's If-None-Match matches `etag`, otherwise None.
+
+    We only ever send the ETag for final pages, so a client that sends it back must have a final
+    (and thus still valid) copy; we don't need any RPC requests to answer it."""
+    if flask.request.if_none_match.contains_weak(etag):
+        return immutable_response(flask.make_response('', 304), etag)
+    return None
+
+
+def immutable_response(response, etag, timestamp=None):
+    """Sets long-lived caching headers, the ETag, and (if given) the Last-Modified time from a
+    block timestamp on a response for a final block or tx."""
+    response = flask.make_response(response)
+    response.set_etag(etag, weak=True)
+    if timestamp:
+        response.last_modified = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(config.immutable_max_age)
+    return response
+
+
+def is_final(info, height):
+    return height is not None and height + config.finality_depth <= info['height']
+
 @app.route('/style.css')
 def css():
     return flask.send_from_directory('static', 'style.css')
@@ -188,25 +265,11 @@ def get_sns_future(omq, oxend):
                     'staking_requirement', 'portions_for_operator', 'operator_address', 'pubkey_ed25519',
                     'last_uptime_proof', 'state_height', 'swarm_id') } })
 
+sn_registry = SNRegistry(config.sn_changes_max)
+
 def get_sns(sns_future, info_future):
-    info = info_future.get()
-    awaiting_sns, active_sns, inactive_sns = [], [], []
-    sn_states = sns_future.get()
-    sn_states = sn_states['service_node_states'] if 'service_node_states' in sn_states else []
-    for sn in sn_states:
-        sn['contribution_open'] = sn['staking_requirement'] - sn['total_reserved']
-        sn['contribution_required'] = sn['staking_requirement'] - sn['total_contributed']
-        sn['num_contributions'] = sum(len(x['locked_contributions']) for x in sn['contributors'] if 'locked_contributions' in x)
-
-        if sn['active']:
-            active_sns.append(sn)
-        elif sn['funded']:
-            sn['decomm_blocks_remaining'] = max(sn['earned_downtime_blocks'], 0)
-            sn['decomm_blocks'] = info['height'] - sn['state_height']
-            inactive_sns.append(sn)
-        else:
-            awaiting_sns.append(sn)
-    return awaiting_sns, active_sns, inactive_sns
+    """Returns the indexed ServiceNodeSet (see snregistry.py) for the current service node list"""
+    return sn_registry.get(sns_future.get(), info_future.get()['height'])
 
 
 def get_quorums_future(omq, oxend, height):
@@ -227,25 +290,35 @@ def get_quorums(quorums_future):
             print("Something getting wrong in quorums: found unknown quorum_type={}".format(q['quorum_type']), file=sys.stderr)
     return quo
 
-def get_mempool_future(omq, oxend):
-    return FutureJSON(omq, oxend, 'rpc.get_transaction_pool', 5, args={"tx_extra":True, "stake_info":True})
-
-def parse_mempool(mempool_future):
-    # mempool RPC return values are about as nasty as can be.  For each mempool tx, we get back
-    # *both* binary+hex encoded values and JSON-encoded values slammed into a string, which means we
-    # have to invoke an *extra* JSON parser for each tx.  This is terrible.
-    mp = mempool_future.get()
-    if 'transactions' in mp:
-        # If we have a cached value we have already sorted it
-        if '_sorted' not in mp:
-            mp['transactions'].sort(key=lambda tx: (tx['receive_time'], tx['id_hash']))
-            mp['_sorted'] = True
-
-        for tx in mp['transactions']:
-            tx['info'] = json.loads(tx["tx_json"])
-    else:
-        mp['transactions'] = []
-    return mp
+# Cache of fully rendered list pages.  These are keyed by the route arguments along with the chain
+# height (and mempool version, where relevant), so they are re-rendered as soon as the underlying
+# data changes, but otherwise only once every `config.page_cache_seconds` (so that the displayed
+# ages don't get too far out of date).
+page_cache = LRUCache(config.page_cache_entries, config.page_cache_bytes)
+
+def cached_page(key):
+    """Returns the cached rendering of the page with the given key, or None"""
+    return page_cache.get(key) if config.page_cache_seconds else None
+
+def cache_page(key, html):
+    """Caches a rendered page under `key`, and returns it"""
+    if config.page_cache_seconds:
+        page_cache.set(key, html, html, config.page_cache_seconds)
+    return html
+
+
+mempool_tracker = MempoolTracker()
+
+def get_mempool(omq, oxend):
+    """Returns the current view of the mempool (see MempoolTracker): a dict with the
+    'transactions' sorted by receive time (each with the embedded tx json parsed into 'info' on
+    demand), their total 'size', and a 'version' that changes whenever the mempool does.  Doesn't
+    wait on oxend for the details of new txs (other than for the very first view)."""
+    return mempool_tracker.get(omq, oxend)
+
+
+# Circulating supply totals, kept up to date in the background (see EmissionTally)
+emission_tally = EmissionTally()
 
 
 @app.context_processor
@@ -267,35 +340,67 @@ def template_globals():
 @app.route('/autorefresh/<int:refresh>')
 @app.route('/v<int:style>') # debug while mucking with stylesheets
 @app.route('/')
+@live_cache_policy
 def main(refresh=None, page=0, per_page=None, first=None, last=None, style=None):
     omq, oxend = omq_connection()
     inforeq = FutureJSON(omq, oxend, 'rpc.get_info', 1)
+    # Started before anything waits (e.g. on the mempool) so that they all run in parallel; they
+    # are almost always cached, so this costs next to nothing when the page itself is cached.
     stake = FutureJSON(omq, oxend, 'rpc.get_staking_requirement', 10)
     base_fee = FutureJSON(omq, oxend, 'rpc.get_fee_estimate', 10)
     hfinfo = FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10)
     accrued = FutureJSON(omq, oxend, 'rpc.get_accrued_batched_earnings', 1)
-    mempool = get_mempool_future(omq, oxend)
     sns = get_sns_future(omq, oxend)
     checkpoints = FutureJSON(omq, oxend, 'rpc.get_checkpoints', args={"count": 3})
+    mempool = get_mempool(omq, oxend)
 
-    # This call is slow the first time it gets called in oxend but will be fast after that, so call
-    # it with a very short timeout.  It's also an admin-only command, so will always fail if we're
-    # using a restricted RPC interface.
-    coinbase = FutureJSON(omq, oxend, 'admin.get_coinbase_tx_sum', 10, timeout=1, fail_okay=True,
-            args={"height":0, "count":2**31-1})
+    page_key = ('main', refresh, page, per_page, first, last, style, inforeq.get()['height'], mempool['version'])
+    html = cached_page(page_key)
+    if html is not None:
+        return html
 
+    # We have some chained request dependencies here and below, so get() them as needed; all other
+    # non-dependent requests should already have a future initiated above so that they can
+    # potentially run in parallel.
+    info = inforeq.get()
+    start_height, end_height, page, per_page, custom_per_page = index_range(info['height'], page, per_page, first, last)
+
+    blocks = get_block_range(omq, oxend, start_height, end_height)
+
+    sns = get_sns(sns, inforeq)
+
+    return cache_page(page_key, flask.render_template('index.html',
+            info=info,
+            stake=stake.get(),
+            fees=base_fee.get(),
+            emission=emission_tally.get(),
+            accrued_total=sum(accrued.get()['amounts']),
+            hf=hfinfo.get(),
+            active_sns=sns.by_state['active'],
+            active_swarms=sns.active_swarms,
+            inactive_sns=sns.by_state['decommissioned'],
+            awaiting_sns=sns.by_state['awaiting'],
+            blocks=blocks,
+            block_size_median=statistics.median(b['block_size'] for b in blocks),
+            page=page,
+            per_page=per_page,
+            custom_per_page=custom_per_page,
+            mempool=mempool,
+            checkpoints=checkpoints.get(),
+            refresh=refresh,
+            live_updates=bool(config.live_updates and refresh and page == 0),
+            ))
+
+
+def index_range(height, page=0, per_page=None, first=None, last=None):
+    """Returns the (start_height, end_height, page, per_page, custom_per_page) of the blocks shown
+    by the index page, given the chain height and the route arguments."""
     custom_per_page = ''
     if per_page is None or per_page <= 0 or per_page > config.max_blocks_per_page:
         per_page = config.blocks_per_page
     else:
         custom_per_page = '/{}'.format(per_page)
 
-    # We have some chained request dependencies here and below, so get() them as needed; all other
-    # non-dependent requests should already have a future initiated above so that they can
-    # potentially run in parallel.
-    info = inforeq.get()
-    height = info['height']
-
     # Permalinked block range:
     if first is not None and last is not None and 0 <= first <= last and last <= first + 99:
         start_height, end_height = first, last
@@ -310,28 +415,59 @@ def main(refresh=None, page=0, per_page=None, first=None, last=None, style=None)
         end_height = max(0, height - per_page*page - 1)
         start_height = max(0, end_height - per_page + 1)
 
-    blocks = FutureJSON(omq, oxend, 'rpc.get_block_headers_range', cache_key='main', args={
+    return start_height, end_height, page, per_page, custom_per_page
+
+
+chain_index = None
+chain_index_lock = threading.Lock()
+def get_chain_index():
+    """Returns the local chain index (see indexer.py), or None if not enabled via config.index_db"""
+    global chain_index
+    if chain_index is None and config.index_db:
+        with chain_index_lock:
+            if chain_index is None:
+                chain_index = ChainIndex(config.index_db)
+    return chain_index
+
+
+def block_range_req(omq, oxend, start_height, end_height):
+    return FutureJSON(omq, oxend, 'rpc.get_block_headers_range', cache_key='main', final_height=headers_final_height, args={
         'start_height': start_height,
         'end_height': end_height,
         'get_tx_hashes': True,
-        }).get()['headers']
-
-    # If 'txs' is already there then it is probably left over from our cached previous call through
-    # here.
-    if blocks and 'txs' not in blocks[0]:
-        txids = []
-        for b in blocks:
-            b['txs'] = []
-            if 'miner_tx_hash' in b and b['miner_tx_hash']:
-                txids.append(b['miner_tx_hash'])
-            if 'tx_hashes' in b:
-                txids += b['tx_hashes']
-        if txids:
-            txs = parse_txs(tx_req(omq, oxend, txids, cache_key='mempool').get())
+        })
+
+
+def block_range_txs_req(omq, oxend, headers):
+    """Returns the request for the txs (miner txs included) of the given block_range_req headers,
+    or None if there aren't any"""
+    txids = []
+    for b in headers:
+        if 'miner_tx_hash' in b and b['miner_tx_hash']:
+            txids.append(b['miner_tx_hash'])
+        if 'tx_hashes' in b:
+            txids += b['tx_hashes']
+    return tx_req(omq, oxend, txids, cache_key='mempool') if txids else None
+
+
+def get_block_range(omq, oxend, start_height, end_height):
+    """Returns the block headers from start_height to end_height, each with a 'txs' list of tx
+    summaries (see indexer.tx_summary).  These come from the local chain index when it has the
+    whole range, and otherwise from oxend."""
+    blocks = get_chain_index().blocks(start_height, end_height) if get_chain_index() else None
+    if blocks is not None:
+        return blocks
+
+    headers = block_range_req(omq, oxend, start_height, end_height).get()['headers']
+
+    # The headers are shared through the cache, so we add the txs to copies of them:
+    blocks = [dict(b, txs=[]) for b in headers]
+    if blocks:
+        txs = block_range_txs_req(omq, oxend, headers)
+        if txs is not None:
+            txs = parse_txs(txs.get())
             i = 0
             for tx in txs:
-                if 'vin' in tx['info'] and len(tx['info']['vin']) == 1 and 'gen' in tx['info']['vin'][0]:
-                    tx['coinbase'] = True
                 # TXs should come back in the same order so we can just skip ahead one when the block
                 # height changes rather than needing to search for the block
                 if blocks[i]['height'] != tx['block_height']:
@@ -342,60 +478,98 @@ def main(refresh=None, page=0, per_page=None, first=None, last=None, style=None)
                     if i >= len(blocks):
                         print("Something getting wrong: have leftover txes")
                         break
-                blocks[i]['txs'].append(tx)
+                blocks[i]['txs'].append(tx_summary(tx))
 
-    # Clean up the SN data a bit to make things easier for the templates
-    awaiting_sns, active_sns, inactive_sns = get_sns(sns, inforeq)
-
-    return flask.render_template('index.html',
-            info=info,
-            stake=stake.get(),
-            fees=base_fee.get(),
-            emission=coinbase.get(),
-            accrued_total=sum(accrued.get()['amounts']),
-            hf=hfinfo.get(),
-            active_sns=active_sns,
-            active_swarms=len(set(x['swarm_id'] for x in active_sns)),
-            inactive_sns=inactive_sns,
-            awaiting_sns=awaiting_sns,
-            blocks=blocks,
-            block_size_median=statistics.median(b['block_size'] for b in blocks),
-            page=page,
-            per_page=per_page,
-            custom_per_page=custom_per_page,
-            mempool=parse_mempool(mempool),
-            checkpoints=checkpoints.get(),
-            refresh=refresh,
-            )
+    return blocks
 
 
 @app.route('/txpool')
+@live_cache_policy
 def mempool():
+    paging = mempool_paging()
+    if paging is None:
+        return flask.abort(400)
+
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
-    mempool = get_mempool_future(omq, oxend)
+    mempool = get_mempool(omq, oxend)
 
-    return flask.render_template('mempool.html',
+    page_key = ('mempool', *paging.values(), info.get()['height'], mempool['version'])
+    html = cached_page(page_key)
+    if html is not None:
+        return html
+
+    return cache_page(page_key, flask.render_template('mempool.html',
             info=info.get(),
-            mempool=parse_mempool(mempool),
-            )
+            mempool=mempool,
+            mempool_txs=mempool_page(mempool, **paging),
+            paging=paging,
+            ))
+
+
+def mempool_paging():
+    return request_paging(mempool_sort_orders, 'time', config.mempool_per_page, config.max_mempool_per_page)
+
+
+def request_paging(sort_orders, default_sort, default_per_page, max_per_page):
+    """Extracts paging and sorting parameters from the request's `page`, `per_page`, `sort` and
+    `order` query string values, where `sort_orders` maps the valid sort names to (key, default
+    to descending) pairs.  Returns None if any are invalid."""
+    args = flask.request.args
+    try:
+        paging = {
+            'sort': args.get('sort', default_sort),
+            'desc': {None: None, 'asc': False, 'desc': True}[args.get('order')],
+            'page': int(args.get('page', 0)),
+            'per_page': int(args.get('per_page', default_per_page)),
+        }
+    except (KeyError, ValueError):
+        return None
+    if paging['sort'] not in sort_orders or paging['page'] < 0 or not 0 < paging['per_page'] <= max_per_page:
+        return None
+    if paging['desc'] is None:
+        paging['desc'] = sort_orders[paging['sort']][1]
+    return paging
 
 @app.route('/service_nodes')
+@live_cache_policy
 def sns():
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
-    awaiting, active, inactive = get_sns(get_sns_future(omq, oxend), info)
 
-    return flask.render_template('service_nodes.html',
+    page_key = ('sns', info.get()['height'])
+    html = cached_page(page_key)
+    if html is not None:
+        return html
+
+    sns = get_sns(get_sns_future(omq, oxend), info)
+
+    return cache_page(page_key, flask.render_template('service_nodes.html',
         info=info.get(),
-        active_sns=active,
-        active_swarms=len(set(x['swarm_id'] for x in active)),
-        awaiting_sns=awaiting,
-        inactive_sns=inactive,
-        )
+        active_sns=sns.by_state['active'],
+        active_swarms=sns.active_swarms,
+        awaiting_sns=sns.by_state['awaiting'],
+        inactive_sns=sns.by_state['decommissioned'],
+        ))
+
+# Functions to extract the block height that an RPC response is tied to, for storing final blocks
+# and transactions in the persistent cache (see FutureJSON's `final_height`).
+def txs_final_height(txs_rpc):
+    """Returns the height of the most recent block containing one of the txs, or None if any tx is
+    missing or in the mempool"""
+    if not txs_rpc.get('txs') or txs_rpc.get('missed_tx') or any(tx.get('in_pool') or 'block_height' not in tx for tx in txs_rpc['txs']):
+        return None
+    return max(tx['block_height'] for tx in txs_rpc['txs'])
+
+def block_final_height(block_rpc):
+    return block_rpc['block_header']['height'] if 'block_header' in block_rpc else None
+
+def headers_final_height(headers_rpc):
+    return max(h['height'] for h in headers_rpc['headers']) if headers_rpc.get('headers') else None
+
 
 def tx_req(omq, oxend, txids, cache_key='single', **kwargs):
-    return FutureJSON(omq, oxend, 'rpc.get_transactions', cache_seconds=10, cache_key=cache_key,
+    return FutureJSON(omq, oxend, 'rpc.get_transactions', cache_seconds=10, cache_key=cache_key, final_height=txs_final_height,
             args={
                 "txs_hashes": txids,
                 "decode_as_json": True,
@@ -413,10 +587,10 @@ def sn_req(omq, oxend, pubkey, **kwargs):
 
 def block_header_req(omq, oxend, hash_or_height, **kwargs):
     if isinstance(hash_or_height, int) or (len(hash_or_height) <= 10 and hash_or_height.isdigit()):
-        return FutureJSON(omq, oxend, 'rpc.get_block_header_by_height', cache_key='single',
+        return FutureJSON(omq, oxend, 'rpc.get_block_header_by_height', cache_key='single', final_height=block_final_height,
                 args={ "height": int(hash_or_height) }, **kwargs)
     else:
-        return FutureJSON(omq, oxend, 'rpc.get_block_header_by_hash', cache_key='single',
+        return FutureJSON(omq, oxend, 'rpc.get_block_header_by_hash', cache_key='single', final_height=block_final_height,
                 args={ 'hash': hash_or_height }, **kwargs)
 
 
@@ -427,15 +601,94 @@ def block_with_txs_req(omq, oxend, hash_or_height, **kwargs):
     else:
         args['hash'] = hash_or_height
 
-    return FutureJSON(omq, oxend, 'rpc.get_block', cache_key='single', args=args, **kwargs)
+    return FutureJSON(omq, oxend, 'rpc.get_block', cache_key='single', args=args, final_height=block_final_height, **kwargs)
+
+ons_types = {'session':0,'wallet':1,'lokinet':2}
+
+def ons_full_name(name, ons_type):
+    # Lokinet names are hashed (and encrypted) with the .loki on the end
+    return name + '.loki' if ons_type == 2 else name
+
+
+def valid_ons_name(name):
+    return len(name) <= 64 and all(c.isalnum() or c in '_-' for c in name)
+
+
+def ons_info(omq, oxend, name, **kwargs):
+    """Looks up the owners of `name` for all ONS types with a single request"""
+    import nacl.hash, nacl.encoding
+    return FutureJSON(omq, oxend, 'rpc.ons_names_to_owners', config.ons_cache_seconds, args={
+        "entries": [{
+            'name_hash': nacl.hash.blake2b(ons_full_name(name, t).encode(), encoder=nacl.encoding.Base64Encoder).decode('ascii'),
+            'types': [t]} for t in ons_types.values()]},
+        **kwargs)
+
+
+SESSION_ENCRYPTED_LENGTH = 146  # If the encrypted value is not of expected character
+WALLET_ENCRYPTED_LENGTH = 210   # length it is of HF15 and before.
+LOKINET_ENCRYPTED_LENGTH = 144  # The user must update their session mapping.
+
+@functools.lru_cache(maxsize=config.ons_mapping_cache_size)
+def ons_mapping(name, ons_type, encrypted_value):
+    """Decrypts and formats the mapping value of an ONS record.  The result depends only on the
+    arguments (the name determining the name hash), so it gets cached."""
+    import nacl.hash, nacl.encoding, pysodium
+    if len(encrypted_value) not in [SESSION_ENCRYPTED_LENGTH, WALLET_ENCRYPTED_LENGTH, LOKINET_ENCRYPTED_LENGTH]:
+        # Encryption involves a much more expensive argon2-based calculation for HF15 registrations.
+        # Owners should be notified they should update to the new encryption format.
+        return 'Owner needs to update their ID for mapping info.'
+
+    # RPC returns encrypted_value as ciphertext and nonce concatenated.
+    # The nonce is the last 48 characters of the encrypted value and the remainder of characters is the encrypted_value.
+    nonce_received = encrypted_value[-48:]
+    nonce = bytes.fromhex(nonce_received)
+
+    # The ciphertext is the encrypted_value with the nonce taken away.
+    ciphertext = bytes.fromhex(encrypted_value[:-48])
+
+    # If ons type is lokinet we need to add .loki to the name before hashing.
+    name = ons_full_name(name, ons_type)
+
+    # Calculate the blake2b hash of the lower-case full name
+    name_hash = nacl.hash.blake2b(name.encode(),encoder = nacl.encoding.RawEncoder)
+
+    # Decryption key: another blake2b hash, but this time a keyed blake2b hash where the first hash is the key
+    decryption_key = nacl.hash.blake2b(name.encode(), key=name_hash, encoder = nacl.encoding.RawEncoder)
 
-def ons_info(omq, oxend, name,ons_type,**kwargs):
-    if ons_type == 2:
-        name=name+'.loki'
-    name_hash = nacl.hash.blake2b(name.encode(), encoder = nacl.encoding.Base64Encoder)
+    # XChaCha20+Poly1305 decryption
+    val = pysodium.crypto_aead_xchacha20poly1305_ietf_decrypt(ciphertext=ciphertext, ad=b'', nonce=nonce, key=decryption_key)
 
-    return FutureJSON(omq, oxend, 'rpc.ons_names_to_owners', args={
-      "entries": [{'name_hash':name_hash.decode('ascii'),'types':[ons_type]}]})
+    if ons_type == 0:
+        return val.hex()
+
+    if ons_type == 1:
+        network = val[:1] # For mainnet, primary address.  Subaddress is \x74; integrated is \x73; testnet are longer.
+
+        if network == b'\x00':
+            network = b'\x72'
+
+        if network == b'\x01':
+            network = b'\x74'
+
+        if len(val) > 65:
+            network = b'\x73'
+
+        return base58.encode_address(network + val[1:])
+
+    # val will currently be the raw lokinet ed25519 pubkey (32 bytes).  We can convert it to the more
+    # common lokinet address (which is the same value but encoded in z-base-32) and convert the bytes to
+    # a string:
+    val = b32encode(val).decode()
+
+    # Python's regular base32 uses a different alphabet, so translate from base32 to z-base-32:
+    val = val.translate(str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567",
+                                      "ybndrfg8ejkmcpqxot1uwisza345h769"))
+
+    # Base32 is also padded with '=', which isn't used in z-base-32:
+    val = val.rstrip('=')
+
+    # Finally slap ".loki" on the end:
+    return val + ".loki"
 
 
 @app.route('/ons/<string:name>')
@@ -445,114 +698,31 @@ def show_ons(name, more_details=False):
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
 
-    if len(name) > 64 or not all(c.isalnum() or c in '_-' for c in name):
+    if not valid_ons_name(name):
         return flask.render_template('not_found.html',
             info=info.get(),
             type='bad_search',
             id=name,
             )
 
-    ons_types = {'session':0,'wallet':1,'lokinet':2}
+    onsinfo = ons_info(omq, oxend, name).get()
+    entries = {e['type']: e for e in onsinfo.get('entries', [])} if onsinfo else {}
     ons_data = {'name':name}
-    SESSION_ENCRYPTED_LENGTH = 146  # If the encrypted value is not of expected character 
-    WALLET_ENCRYPTED_LENGTH = 210   # length it is of HF15 and before.
-    LOKINET_ENCRYPTED_LENGTH = 144  # The user must update their session mapping.
 
     for ons_type in ons_types:
-        onsinfo = ons_info(omq, oxend, name, ons_types[ons_type]).get()
-
-        if 'entries' not in onsinfo:
+        entry = entries.get(ons_types[ons_type])
+        if entry is None:
             # If returned with no data from the RPC
             if (ons_types[ons_type] == 2 and '-' in name and len(name) > 63) or (ons_types[ons_type] == 2 and '-' not in name and len(name) > 32):
                 ons_data[ons_type] = False
             else:
                 ons_data[ons_type] = True
-
         else:
-            onsinfo = onsinfo['entries'][0]
-            ons_data[ons_type] = onsinfo
-
-            if len(onsinfo['encrypted_value']) not in [SESSION_ENCRYPTED_LENGTH, WALLET_ENCRYPTED_LENGTH, LOKINET_ENCRYPTED_LENGTH]:
-                # Encryption involves a much more expensive argon2-based calculation for HF15 registrations.
-                # Owners should be notified they should update to the new encryption format.
-                ons_data[ons_type] = ons_info(omq, oxend, name,ons_types[ons_type]).get()['entries'][0]
-                ons_data[ons_type]['mapping'] = 'Owner needs to update their ID for mapping info.'
-                
-            else:
-                # RPC returns encrypted_value as ciphertext and nonce concatenated.
-                # The nonce is the last 48 characters of the encrypted value and the remainder of characters is the encrypted_value.
-                nonce_received = onsinfo['encrypted_value'][-48:]
-                nonce = bytes.fromhex(nonce_received)
-
-                # The ciphertext is the encrypted_value with the nonce taken away.
-                ciphertext = bytes.fromhex(onsinfo['encrypted_value'][:-48])
-
-                # If ons type is lokinet we need to add .loki to the name before hashing.
-                if ons_types[ons_type] == 2:
-                    name+='.loki'
-
-                # Calculate the blake2b hash of the lower-case full name
-                name_hash = nacl.hash.blake2b(name.encode(),encoder = nacl.encoding.RawEncoder)
-
-                # Decryption key: another blake2b hash, but this time a keyed blake2b hash where the first hash is the key
-                decryption_key = nacl.hash.blake2b(name.encode(), key=name_hash, encoder = nacl.encoding.RawEncoder)
-                
-                # XChaCha20+Poly1305 decryption
-                val = pysodium.crypto_aead_xchacha20poly1305_ietf_decrypt(ciphertext=ciphertext, ad=b'', nonce=nonce, key=decryption_key)
-                
-                if ons_types[ons_type] == 0:
-                    ons_data[ons_type]['mapping'] = val.hex()
-                    continue
-
-                if ons_types[ons_type] == 1:
-                    network = val[:1] # For mainnet, primary address.  Subaddress is \x74; integrated is \x73; testnet are longer.
-                    
-                    if network == b'\x00':
-                        network = b'\x72'
-
-                    if network == b'\x01':
-                        network = b'\x74'
-
-                    if len(val) > 65:
-                        network = b'\x73'
-
-                    val = val[1:]
-                    keccak_hash = keccak.new(digest_bits=256)
-                    keccak_hash.update(network)
-                    keccak_hash.update(val)
-                    checksum = keccak_hash.digest()[0:4]
-
-                    val = network + val + checksum
-
-                    ons_data[ons_type]['mapping'] = base58.encode(val.hex())
-                    continue
-
-                if ons_types[ons_type] == 2:
-                    # val will currently be the raw lokinet ed25519 pubkey (32 bytes).  We can convert it to the more
-                    # common lokinet address (which is the same value but encoded in z-base-32) and convert the bytes to
-                    # a string:
-                    val = b32encode(val).decode()
-
-                    # Python's regular base32 uses a different alphabet, so translate from base32 to z-base-32:
-                    val = val.translate(str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", 
-                                                      "ybndrfg8ejkmcpqxot1uwisza345h769"))
-
-                    # Base32 is also padded with '=', which isn't used in z-base-32:
-                    val = val.rstrip('=')
-
-                    # Finally slap ".loki" on the end:
-                    val += ".loki"
-
-                    ons_data[ons_type]['mapping'] = val
-                    continue
-                    
+            # Copy the (cached, shared) entry rather than modifying it:
+            ons_data[ons_type] = {**entry, 'mapping': ons_mapping(name, ons_types[ons_type], entry['encrypted_value'])}
 
     if more_details:
-        formatter = HtmlFormatter(cssclass="syntax-highlight", style="paraiso-dark")
-        more_details = {
-                'details_css': formatter.get_style_defs('.syntax-highlight'),
-                'details_html': highlight(json.dumps(ons_data, indent="\t"), JsonLexer(), formatter),
-                }
+        more_details = highlighted_details(ons_data, 'paraiso-dark', sort_keys=False)
     else:
         more_details = {}
                 
@@ -580,7 +750,8 @@ def show_sn(pubkey, more_details=False):
                 id=pubkey,
                 )
 
-    sn = sn['service_node_states'][0]
+    # Copied, since the response is shared through the cache
+    sn = dict(sn['service_node_states'][0])
     # These are a bit non-trivial to properly calculate:
 
     # Number of staked contributions
@@ -591,11 +762,7 @@ def show_sn(pubkey, more_details=False):
     sn['num_open_spots'] = 0 if sn['total_reserved'] >= sn['staking_requirement'] else max(0, 4 - sn['num_contributions'] - sn['num_reserved_spots'])
 
     if more_details:
-        formatter = HtmlFormatter(cssclass="syntax-highlight", style="paraiso-dark")
-        more_details = {
-                'details_css': formatter.get_style_defs('.syntax-highlight'),
-                'details_html': highlight(json.dumps(sn, indent="\t", sort_keys=True), JsonLexer(), formatter),
-                }
+        more_details = highlighted_details(sn, 'paraiso-dark')
     else:
         more_details = {}
 
@@ -608,42 +775,120 @@ def show_sn(pubkey, more_details=False):
             )
 
 
-@app.route('/qr/<hex64:pubkey>')
-def qr_sn_pubkey(pubkey):
+@functools.lru_cache(maxsize=config.qr_cache_size)
+def qr_image(data, svg=False):
+    """Renders (and caches) a QR code of `data` as PNG or, if `svg` is True, SVG image data"""
+    import qrcode
     qr = qrcode.QRCode(
         box_size=5,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
     )
-    qr.add_data(pubkey.upper())
+    qr.add_data(data)
+    if svg:
+        # Draw this ourselves as a single path of the dark modules, which is much cheaper than
+        # going through PIL (or qrcode's svg factories), and gives us the same colours as the PNG.
+        matrix = qr.get_matrix()
+        size = len(matrix)
+        path = ''.join('M{},{}h1v1h-1z'.format(x, y) for y, row in enumerate(matrix) for x, dark in enumerate(row) if dark)
+        return ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {0} {0}" width="{1}" height="{1}" shape-rendering="crispEdges">'
+                '<rect width="{0}" height="{0}" fill="#dbf7f5"/><path fill="#1e1d48" d="{2}"/></svg>').format(
+                        size, size * qr.box_size, path).encode()
     img = qr.make_image(
         fill_color="#1e1d48",
         back_color="#dbf7f5"
     )
     with BytesIO() as output:
         img.save(output, format="PNG")
-        r = flask.make_response(output.getvalue())
-    r.headers.set('Content-Type', 'image/png')
+        return output.getvalue()
+
+
+@app.route('/qr/<hex64:pubkey>')
+@app.route('/qr/<hex64:pubkey>.svg', defaults={'svg': True})
+def qr_sn_pubkey(pubkey, svg=False):
+    pubkey = pubkey.upper()
+    # The image depends only on the pubkey and format (and our code), so it can be cached forever
+    # and is the same byte-for-byte every time, which allows a strong ETag.
+    etag = final_etag('qr', pubkey, 'svg' if svg else 'png')
+    if flask.request.if_none_match.contains(etag):
+        r = flask.make_response('', 304)
+    else:
+        r = flask.make_response(qr_image(pubkey, svg))
+        r.headers.set('Content-Type', 'image/svg+xml' if svg else 'image/png')
+    r.set_etag(etag)
+    r.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(config.immutable_max_age)
     return r
 
 
+@functools.lru_cache(maxsize=None)
+def details_formatter(style):
+    """Returns the pygments formatter and its css for the given style"""
+    # pygments is fairly slow to load, so we don't import it until first needed
+    from pygments.formatters import HtmlFormatter
+    formatter = HtmlFormatter(cssclass="syntax-highlight", style=style)
+    return formatter, formatter.get_style_defs('.syntax-highlight')
+
+
+# Syntax-highlighted "more details" html, keyed by style and a hash of the JSON being highlighted
+details_cache = LRUCache(config.details_cache_entries, config.details_cache_bytes)
+
+def highlighted_details(data, style, sort_keys=True):
+    """Returns the `details_css` and `details_html` template values for the syntax-highlighted JSON
+    of `data` shown in "more details" mode.  JSON larger than `config.details_highlight_max` isn't
+    highlighted at all (highlighting is slow, and this would otherwise make it easy to tie up the
+    observer by requesting the details of big blocks)."""
+    text = json.dumps(data, indent="\t", sort_keys=sort_keys)
+    formatter, css = details_formatter(style)
+    if len(text) > config.details_highlight_max:
+        return {
+            'details_css': css,
+            'details_html': '<div class="syntax-highlight"><pre>{}</pre></div>'.format(escape_html(text)),
+        }
+
+    key = (style, hashlib.blake2b(text.encode(), digest_size=16).digest())
+    highlighted = details_cache.get(key)
+    if highlighted is None:
+        from pygments import highlight
+        from pygments.lexers import JsonLexer
+        highlighted = highlight(text, JsonLexer(), formatter)
+        details_cache.set(key, highlighted, highlighted, config.details_cache_seconds)
+    return {'details_css': css, 'details_html': highlighted}
+
+
+def parse_tx(tx):
+    """Returns a copy of a tx from a tx_req(...).get() response with the embedded nested json parsed
+    into 'info'"""
+    tx = dict(tx)
+    if 'info' not in tx:
+        # We have serialized JSON data inside a field in the JSON, because of oxend's
+        # multiple incompatible JSON generators 🤮:
+        tx['info'] = json.loads(tx.pop("as_json"))
+        # The "extra" field inside as_json is retardedly in per-byte integer values,
+        # convert it to a hex string 🤮:
+        tx['info']['extra'] = bytes_to_hex(tx['info']['extra'])
+    return tx
+
+
 def parse_txs(txs_rpc):
     """Takes a tx_req(...).get() response and parses the embedded nested json into something useful
 
-    This modifies the txs_rpc['txs'] values in-place.  Returns txs_rpc['txs'] if it exists, otherwise an empty list.
+    The response itself (which is shared through the cache) is left untouched: returns a new list
+    of parsed copies of txs_rpc['txs'] (see parse_tx), or an empty list if there are no txs.
     """
-    if 'txs' not in txs_rpc:
-        return []
+    return [parse_tx(tx) for tx in txs_rpc.get('txs', [])]
+
 
-    for tx in txs_rpc['txs']:
-        if 'info' not in tx:
-            # We have serialized JSON data inside a field in the JSON, because of oxend's
-            # multiple incompatible JSON generators 🤮:
-            tx['info'] = json.loads(tx["as_json"])
-            del tx['as_json']
-            # The "extra" field inside as_json is retardedly in per-byte integer values,
-            # convert it to a hex string 🤮:
-            tx['info']['extra'] = bytes_to_hex(tx['info']['extra'])
-    return txs_rpc['txs']
+def parse_block(block):
+    """Returns a copy of a block_with_txs_req(...).get() response with the embedded block json
+    parsed into 'info'"""
+    block = dict(block)
+    if 'info' not in block:
+        try:
+            block['info'] = json.loads(block.pop("json"))
+            del block['info']['miner_tx']  # Doesn't include enough for us, we fetch it separately with extra interpretation instead
+        except Exception as e:
+            print("Something getting wrong: cannot parse block json for block {}: {}".format(
+                block['block_header']['height'], e), file=sys.stderr)
+    return block
 
 
 def get_block_txs_future(omq, oxend, block):
@@ -653,13 +898,6 @@ def get_block_txs_future(omq, oxend, block):
     miner_tx = block['block_header'].get('miner_tx_hash')
     if miner_tx:
         hashes.append(miner_tx)
-    if 'info' not in block:
-        try:
-            block['info'] = json.loads(block["json"])
-            del block['info']['miner_tx']  # Doesn't include enough for us, we fetch it separately with extra interpretation instead
-            del block["json"]
-        except Exception as e:
-            print("Something getting wrong: cannot parse block json for block {}: {}".format(block_height, e), file=sys.stderr)
 
     return tx_req(omq, oxend, hashes, cache_key='block')
 
@@ -669,6 +907,11 @@ def get_block_txs_future(omq, oxend, block):
 @app.route('/block/<hex64:hash>')
 @app.route('/block/<hex64:hash>/<int:more_details>')
 def show_block(height=None, hash=None, more_details=False):
+    etag = final_etag('block', hash if hash is not None else height, int(more_details))
+    r = not_modified(etag)
+    if r:
+        return r
+
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
     hfinfo = FutureJSON(omq, oxend, 'rpc.hard_fork_info', 10)
@@ -687,6 +930,7 @@ def show_block(height=None, hash=None, more_details=False):
                 id=hash
                 )
 
+    block = parse_block(block)
     next_block = None
     block_height = block['block_header']['height']
     txs = get_block_txs_future(omq, oxend, block)
@@ -695,18 +939,14 @@ def show_block(height=None, hash=None, more_details=False):
         next_block = block_header_req(omq, oxend, '{}'.format(block_height + 1))
 
     if more_details:
-        formatter = HtmlFormatter(cssclass="syntax-highlight", style="native")
-        more_details = {
-                'details_css': formatter.get_style_defs('.syntax-highlight'),
-                'details_html': highlight(json.dumps(block, indent="\t", sort_keys=True), JsonLexer(), formatter),
-                }
+        more_details = highlighted_details(block, 'native')
     else:
         more_details = {}
 
-    transactions = [] if txs is None else parse_txs(txs.get()).copy()
+    transactions = [] if txs is None else parse_txs(txs.get())
     miner_tx = transactions.pop() if block['block_header'].get('miner_tx_hash') else None
 
-    return flask.render_template("block.html",
+    html = flask.render_template("block.html",
             info=info.get(),
             hfinfo=hfinfo.get(),
             block_header=block['block_header'],
@@ -716,6 +956,9 @@ def show_block(height=None, hash=None, more_details=False):
             next_block=next_block.get() if next_block else None,
             **more_details,
             )
+    if is_final(info.get(), block_height):
+        return immutable_response(html, etag, block['block_header']['timestamp'])
+    return html
  
 
 @app.route('/block/latest')
@@ -728,6 +971,11 @@ def show_block_latest():
 @app.route('/tx/<hex64:txid>')
 @app.route('/tx/<hex64:txid>/<int:more_details>')
 def show_tx(txid, more_details=False):
+    etag = final_etag('tx', txid, int(more_details))
+    r = not_modified(etag)
+    if r:
+        return r
+
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
     txs = tx_req(omq, oxend, [txid]).get()
@@ -788,11 +1036,7 @@ def show_tx(txid, more_details=False):
                         i += 1
 
     if more_details:
-        formatter = HtmlFormatter(cssclass="syntax-highlight", style="paraiso-dark")
-        more_details = {
-                'details_css': formatter.get_style_defs('.syntax-highlight'),
-                'details_html': highlight(json.dumps(tx, indent="\t", sort_keys=True), JsonLexer(), formatter),
-                }
+        more_details = highlighted_details(tx, 'paraiso-dark')
     else:
         more_details = {}
 
@@ -812,7 +1056,7 @@ def show_tx(txid, more_details=False):
         else:
             testing_quorum = None
 
-    return flask.render_template('tx.html',
+    html = flask.render_template('tx.html',
             info=info.get(),
             tx=tx,
             kindex_info=kindex_info,
@@ -820,18 +1064,86 @@ def show_tx(txid, more_details=False):
             testing_quorum=testing_quorum,
             **more_details,
             )
+    if not tx.get('in_pool') and is_final(info.get(), tx.get('block_height')):
+        return immutable_response(html, etag, tx.get('block_timestamp'))
+    return html
 
 
 @app.route('/quorums')
+@live_cache_policy
 def show_quorums():
     omq, oxend = omq_connection()
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
+
+    page_key = ('quorums', info.get()['height'])
+    html = cached_page(page_key)
+    if html is not None:
+        return html
+
     quos = get_quorums_future(omq, oxend, info.get()['height'])
 
-    return flask.render_template('quorums.html',
+    return cache_page(page_key, flask.render_template('quorums.html',
             info=info.get(),
             quorums=get_quorums(quos)
-            )
+            ))
+
+
+def tx_fee(tx):
+    return tx['info']['rct_signatures'].get('txnFee', 0) if 'rct_signatures' in tx['info'] else 0
+
+
+def live_poll():
+    omq, oxend = omq_connection()
+    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
+    mempool = get_mempool(omq, oxend)
+    return info.get()['height'], {tx['id_hash']: {
+            'id_hash': tx['id_hash'],
+            'receive_time': tx['receive_time'],
+            'size': tx['blob_size'],
+            'fee': tx['fee'],
+            'inputs': len(tx['info'].get('vin', [])),
+            'outputs': len(tx['info'].get('vout', [])),
+            } for tx in mempool['transactions']}
+
+
+def live_blocks(start_height, end_height):
+    omq, oxend = omq_connection()
+    return [{
+        'height': b['height'],
+        'hash': b['hash'],
+        'timestamp': b['timestamp'],
+        'block_size': b['block_size'],
+        'coinbase_payouts': b.get('coinbase_payouts', 0),
+        'txs': [{'fee': tx_fee(tx), **{k: tx[k] for k in ('tx_hash', 'coinbase', 'inputs', 'outputs', 'size')}}
+            for tx in b['txs']],
+        } for b in get_block_range(omq, oxend, start_height, end_height)]
+
+
+live_feed = LiveFeed(live_poll, live_blocks)
+
+@app.route('/events')
+def live_events():
+    """Server-sent event stream of new blocks, mempool changes, and height changes (see LiveFeed),
+    used by the index page in autorefresh mode to update itself in place.  Only available if
+    enabled via `config.live_updates`."""
+    if not config.live_updates:
+        return flask.abort(404)
+    q = live_feed.subscribe()
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while live_feed.subscribed(q):
+                try:
+                    yield q.get(timeout=15)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            live_feed.unsubscribe(q)
+
+    return flask.Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+        })
 
 
 base32z_dict = 'ybndrfg8ejkmcpqxot1uwisza345h769'
@@ -901,18 +1213,45 @@ def api_networkinfo():
     return flask.jsonify({"data": data, "status": "OK"})
 
 
+@app.route('/api/mempool')
+def api_mempool():
+    paging = mempool_paging()
+    if paging is None:
+        return flask.jsonify({"status": "Invalid paging or sort parameters"}), 400
+
+    omq, oxend = omq_connection()
+    mempool = get_mempool(omq, oxend)
+    txs = [{
+        'id_hash': tx['id_hash'],
+        'receive_time': tx['receive_time'],
+        'size': tx['blob_size'],
+        'fee': tx['fee'],
+        'relayed': tx['relayed'],
+        'double_spend_seen': tx['double_spend_seen'],
+        'blink': tx['blink'],
+        'version': tx['info']['version'],
+        'type': tx['info'].get('type', 0),
+        'inputs': len(tx['info'].get('vin', [])),
+        'outputs': len(tx['info'].get('vout', [])),
+        'extra': tx['extra'],
+        } for tx in mempool_page(mempool, **paging)]
+
+    return flask.jsonify({"status": "OK", "data": {
+        'count': len(mempool['transactions']),
+        'size': mempool['size'],
+        **paging,
+        'transactions': txs,
+        }})
+
+
 @app.route('/api/emission')
 def api_emission():
-    omq, oxend = omq_connection()
-    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
-    coinbase = FutureJSON(omq, oxend, 'admin.get_coinbase_tx_sum', 10, timeout=1, fail_okay=True,
-            args={"height":0, "count":2**31-1}).get()
+    coinbase = emission_tally.get()
     if not coinbase:
         return flask.jsonify(None)
-    info = info.get()
     return flask.jsonify({
         "data": {
-            "blk_no": info['height'] - 1,
+            "blk_no": coinbase['height'] - 1,
             "burn": coinbase["burn_amount"],
             "circulating_supply": coinbase["emission_amount"] - coinbase["burn_amount"],
             "coinbase": coinbase["emission_amount"] - coinbase["burn_amount"],
@@ -929,23 +1268,10 @@ def api_service_node_stats():
     info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
     stakinginfo = FutureJSON(omq, oxend, 'rpc.get_staking_requirement', 30)
     sns = get_sns_future(omq, oxend)
-    sns = sns.get()
-    if 'service_node_states' not in sns:
+    if not sns.get() or 'service_node_states' not in sns.get():
         return flask.jsonify({"status": "Error retrieving SN stats"}), 500
-    sns = sns['service_node_states']
-
-    stats = {'active': 0, 'funded': 0, 'awaiting_contribution': 0, 'decommissioned': 0, 'staked': 0}
-    for sn in sns:
-        if sn['funded']:
-            stats['funded'] += 1
-            if sn['active']:
-                stats['active'] += 1
-            else:
-                stats['decommissioned'] += 1
-        else:
-            stats['awaiting_contribution'] += 1
-        stats['staked'] += sn['total_contributed']
 
+    stats = dict(get_sns(sns, info).stats)
     stats['staked'] /= 1_000_000_000
     stats['sn_reward'] = 16.5
     stats['sn_reward_interval'] = stats['active']
@@ -958,77 +1284,129 @@ def api_service_node_stats():
     return flask.jsonify({"data": stats, "status": "OK"})
 
 
+@app.route('/api/service_nodes')
+def api_service_nodes():
+    """Service node list, optionally filtered by `state` (active, decommissioned or awaiting),
+    `swarm_id`, `operator` (address) and/or `version` (e.g. 9.2.0), and paged and sorted as per
+    `request_paging`."""
+    paging = request_paging(sn_sort_orders, 'pubkey', config.sn_per_page, config.max_sn_per_page)
+    args = flask.request.args
+    if paging is None or args.get('state') not in (None, 'active', 'decommissioned', 'awaiting'):
+        return flask.jsonify({"status": "Invalid query parameters"}), 400
+    try:
+        swarm_id = int(args['swarm_id']) if 'swarm_id' in args else None
+    except ValueError:
+        return flask.jsonify({"status": "Invalid query parameters"}), 400
+
+    omq, oxend = omq_connection()
+    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
+    sns = get_sns_future(omq, oxend)
+    if not sns.get() or 'service_node_states' not in sns.get():
+        return flask.jsonify({"status": "Error retrieving service nodes"}), 500
+    sns = get_sns(sns, info)
+
+    matches = sns.query(state=args.get('state'), swarm_id=swarm_id,
+            operator=args.get('operator'), version=args.get('version'))
+    return flask.jsonify({"status": "OK", "data": {
+        'height': sns.height,
+        'total': len(matches),
+        **paging,
+        'service_nodes': sns.page(matches, **paging),
+        }})
+
+
+@app.route('/api/service_nodes/changes')
+def api_service_node_changes():
+    """Changes to the service node list since the `since` cursor (see SNRegistry.changes_since).
+    Without `since` (or if the changes since then are no longer available) this just returns the
+    current cursor, with `reset` set to indicate that the caller should (re)fetch the full list
+    from /api/service_nodes."""
+    if not sn_registry.shared and uwsgi is not None and uwsgi.numproc > 1:
+        # Each process would have its own changes, and cursors, so pollers would mostly get resets
+        return flask.jsonify({"status": "Error: the service node change feed requires config.sn_changes_db "
+            "when running multiple processes"}), 503
+    omq, oxend = omq_connection()
+    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
+    sns = get_sns_future(omq, oxend)
+    if not sns.get() or 'service_node_states' not in sns.get():
+        return flask.jsonify({"status": "Error retrieving service nodes"}), 500
+    sns = get_sns(sns, info)
+
+    changes, cursor, reset = sn_registry.changes_since(flask.request.args.get('since'))
+    return flask.jsonify({"status": "OK", "data": {
+        'height': sns.height,
+        'cursor': cursor,
+        'reset': reset,
+        'changes': changes,
+        }})
+
+
 @app.route('/api/circulating_supply')
 def api_circulating_supply():
-    omq, oxend = omq_connection()
-    coinbase = FutureJSON(omq, oxend, 'admin.get_coinbase_tx_sum', 10, timeout=1, fail_okay=True,
-            args={"height":0, "count":2**31-1}).get()
+    coinbase = emission_tally.get()
     return flask.jsonify((coinbase["emission_amount"] - coinbase["burn_amount"]) // 1_000_000_000 if coinbase else None)
 
 
 # FIXME: need better error handling here
 @app.route('/api/transaction/<hex64:txid>')
 def api_tx(txid):
+    etag = final_etag('api-tx', txid)
+    r = not_modified(etag)
+    if r:
+        return r
+
     omq, oxend = omq_connection()
+    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
     tx = tx_req(omq, oxend, [txid]).get()
     txs = parse_txs(tx)
-    return flask.jsonify({
+    r = flask.jsonify({
         "status": tx['status'],
         "data": (txs[0] if txs else None),
         })
+    if txs and not txs[0].get('in_pool') and is_final(info.get(), txs[0].get('block_height')):
+        return immutable_response(r, etag, txs[0].get('block_timestamp'))
+    return r
 
 @app.route('/api/block/<int:height>')
 @app.route('/api/block/<hex64:blkid>')
 def api_block(blkid=None, height=None):
     omq, oxend = omq_connection()
+    info = FutureJSON(omq, oxend, 'rpc.get_info', 1)
     block = block_with_txs_req(omq, oxend, blkid if blkid is not None else height).get()
     txs = get_block_txs_future(omq, oxend, block)
 
     if 'block_header' in block:
         data = block['block_header'].copy()
-        data["txs"] = parse_txs(txs.get()).copy()
+        data["txs"] = parse_txs(txs.get())
+        # The block may have come from the persistent cache, in which case depth is out of date
+        if 'depth' in data:
+            data['depth'] = info.get()['height'] - 1 - data['height']
 
     return flask.jsonify({
         "status": block['status'],
         "data": data,
         })
 
-ticker_vs, ticker_vs_expires = [], None
-ticker_cache, ticker_cache_expires = {}, None
+price_ticker = PriceTicker()
+
 @app.route('/api/prices')
 @app.route('/api/price/<fiat>')
 def api_price(fiat=None):
-    global ticker_cache, ticker_cache_expires, ticker_vs, ticker_vs_expires
-    # TODO: will need to change to 'oxen' when/if the ticker changes:
-    ticker = 'loki-network'
-
-    if not ticker_cache or not ticker_cache_expires or ticker_cache_expires < time.time():
-        if not ticker_vs_expires or ticker_vs_expires < time.time():
-            try:
-                x = requests.get("https://api.coingecko.com/api/v3/simple/supported_vs_currencies").json()
-                if x:
-                    ticker_vs = x
-                    ticker_vs_expires = time.time() + 300
-            except RuntimeError as e:
-                print("Failed to retrieve vs currencies: {}".format(e), file=sys.stderr)
-                # ignore failure because we might have an old value that is still usable
-
-        if not ticker_vs:
-            raise RuntimeError("Failed to retrieve CoinGecko currency list")
-
-        try:
-            x = requests.get("https://api.coingecko.com/api/v3/simple/price?ids={}&vs_currencies={}".format(
-                ticker, ",".join(ticker_vs))).json()
-        except RuntimeError as e:
-            print("Failed to retrieve prices: {}".format(e), file=sys.stderr)
-
-        if not x or ticker not in x or not x[ticker]:
-            raise RuntimeError("Failed to retrieve prices from CoinGecko")
-        ticker_cache = x[ticker]
-        ticker_cache_expires = time.time() + 60
+    prices = price_ticker.get()
+    if prices is None:
+        return flask.jsonify({"status": "Price data is not available yet"}), 503
 
     if fiat is None:
-        return flask.jsonify(ticker_cache)
+        return flask.jsonify(prices)
     else:
         fiat = fiat.lower()
-        return flask.jsonify({ fiat: ticker_cache[fiat] } if fiat in ticker_cache else {})
+        return flask.jsonify({ fiat: prices[fiat] } if fiat in prices else {})
+
+
+def warm_templates():
+    """Compiles (and thus caches) every template now rather than on first use"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+if config.warm_templates:
+    warm_templates()
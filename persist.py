@@ -0,0 +1,67 @@
+import sqlite3
+import sys
+import threading
+import hashlib
+
+
+class PersistentCache():
+    """On-disk (sqlite) store of RPC responses that can never change because they are tied to a
+    block that is buried deeply enough in the chain (see `config.finality_depth`): for instance a
+    block, or a set of transactions mined in old blocks.  Unlike the in-memory cache this is
+    shared by all processes using the same database file and survives restarts.
+
+    Entries are keyed by endpoint and request arguments and hold the raw JSON response, along with
+    the height it is tied to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0}
+        self._db().execute("""
+            CREATE TABLE IF NOT EXISTS rpc_cache (
+                key BLOB PRIMARY KEY,
+                height INTEGER NOT NULL,
+                response BLOB NOT NULL
+            ) WITHOUT ROWID""")
+
+    def _db(self):
+        # sqlite connections can't be shared across threads, so we make one per thread:
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @staticmethod
+    def _key(endpoint, args):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(endpoint.encode())
+        if args is not None:
+            h.update(b'\0')
+            h.update(args)
+        return h.digest()
+
+    def get(self, endpoint, args):
+        """Returns the raw response stored for the given endpoint and (JSON-encoded) args, or None."""
+        try:
+            row = self._db().execute("SELECT response FROM rpc_cache WHERE key = ?",
+                    (self._key(endpoint, args),)).fetchone()
+        except sqlite3.Error as e:
+            print("Something getting wrong: persistent cache lookup failed: {}".format(e), file=sys.stderr)
+            row = None
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return row[0]
+
+    def set(self, endpoint, args, height, raw):
+        try:
+            self._db().execute("INSERT OR REPLACE INTO rpc_cache (key, height, response) VALUES (?, ?, ?)",
+                    (self._key(endpoint, args), height, raw))
+            self.stats['stored'] += 1
+        except sqlite3.Error as e:
+            print("Something getting wrong: persistent cache store failed: {}".format(e), file=sys.stderr)
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import threading
+import config
+
+
+class PriceTicker():
+    """Keeps the current coin price (in every currency CoinGecko supports) up to date in the
+    background.  A single thread per process does all the fetching, with timeouts, every
+    `config.price_refresh_interval` seconds; `get()` just returns the most recently fetched prices
+    (no matter how old, if later fetches are failing), or None if we haven't managed to get any
+    yet.
+
+    The thread is started by the first `get()` in each process, which thus returns None (and the
+    request for prices fails) until the first fetch completes, rather than waiting for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.prices = None
+        self.currencies = None
+        self.currencies_expire = 0
+
+    def start(self):
+        """Starts the fetching thread, unless it is already running in this process.  (A forked
+        process doesn't inherit its parent's threads, so it needs its own.)"""
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.thread = threading.Thread(target=self.run, name='price-ticker', daemon=True)
+                    self.thread.start()
+                    self.pid = os.getpid()
+
+    def get(self):
+        self.start()
+        return self.prices
+
+    def fetch(self, path, **params):
+        import requests
+        r = requests.get(config.price_api_url + path, params=params, timeout=config.price_timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def update(self):
+        import requests
+        if self.currencies is None or self.currencies_expire < time.time():
+            try:
+                currencies = self.fetch('/simple/supported_vs_currencies')
+                if currencies:
+                    self.currencies = currencies
+                    self.currencies_expire = time.time() + config.price_currencies_refresh_interval
+            except (requests.RequestException, ValueError) as e:
+                # Ignore the failure if we have an old list that is still usable
+                if not self.currencies:
+                    raise
+                print("Something getting wrong: failed to retrieve CoinGecko currencies: {}".format(e), file=sys.stderr)
+
+        x = self.fetch('/simple/price', ids=config.price_ticker, vs_currencies=','.join(self.currencies))
+        if not x or config.price_ticker not in x or not x[config.price_ticker]:
+            raise RuntimeError("no {} prices in CoinGecko response".format(config.price_ticker))
+        self.prices = x[config.price_ticker]
+
+    def run(self):
+        # requests is slow to import, so we only load it once something actually wants prices
+        import requests
+        while True:
+            try:
+                self.update()
+            except (requests.RequestException, RuntimeError, ValueError, TypeError) as e:
+                # Connection failures, timeouts, HTTP errors or bad JSON from CoinGecko
+                print("Something getting wrong: failed to retrieve prices: {}".format(e), file=sys.stderr)
+            time.sleep(config.price_refresh_interval)
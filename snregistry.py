@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+import config
+
+
+def sn_version(sn):
+    return '.'.join(str(x) for x in sn['service_node_version'])
+
+
+# Service node list sort orders: name => (sort key, default to descending)
+sort_orders = {
+    'pubkey': (lambda sn: sn['service_node_pubkey'], False),
+    'last_reward': (lambda sn: (sn['last_reward_block_height'], sn['last_reward_transaction_index'], sn['service_node_pubkey']), False),
+    'last_uptime_proof': (lambda sn: (sn['last_uptime_proof'], sn['service_node_pubkey']), True),
+    'state_height': (lambda sn: (sn['state_height'], sn['service_node_pubkey']), True),
+    'version': (lambda sn: (tuple(sn['service_node_version']), sn['service_node_pubkey']), True),
+    'total_contributed': (lambda sn: (sn['total_contributed'], sn['service_node_pubkey']), True),
+    'contribution_open': (lambda sn: (sn['contribution_open'], sn['service_node_pubkey']), True),
+    'operator_fee': (lambda sn: (sn['portions_for_operator'], sn['service_node_pubkey']), False),
+}
+
+# The orders in which each state's list is kept (and displayed in)
+state_orders = {
+    'active': lambda sn: (sn['last_reward_block_height'], sn['last_reward_transaction_index'], sn['service_node_pubkey']),
+    'decommissioned': lambda sn: (sn['earned_downtime_blocks'], sn['state_height'], sn['last_uptime_proof'], sn['service_node_pubkey']),
+    'awaiting': lambda sn: (sn['portions_for_operator'], sn['contribution_open'], sn['contribution_required'], sn['service_node_pubkey']),
+}
+
+
+class ServiceNodeSet():
+    """An indexed snapshot of the service node list as of a `get_service_nodes` response.
+
+    Each service node is a copy of its record from the response (the response itself, which may be
+    shared through the cache, is left untouched) with a few derived values added for the templates
+    and API: 'state' (one of 'active', 'decommissioned' or 'awaiting'), 'contribution_open',
+    'contribution_required', 'num_contributions' and, for decommissioned nodes, 'decomm_blocks' and
+    'decomm_blocks_remaining'.
+
+    The nodes are indexed by pubkey, state (each state's list being in display order; see
+    `state_orders`), swarm id, operator address and version.  A snapshot must not be modified once
+    built.
+    """
+
+    def __init__(self, sn_states, height):
+        self.height = height
+        self.nodes = []
+        self.by_pubkey = {}
+        self.by_state = {state: [] for state in state_orders}
+        self.by_swarm = {}
+        self.by_operator = {}
+        self.by_version = {}
+        self.stats = {'active': 0, 'funded': 0, 'awaiting_contribution': 0, 'decommissioned': 0, 'staked': 0}
+
+        for sn in sn_states:
+            sn = dict(sn)
+            sn['contribution_open'] = sn['staking_requirement'] - sn['total_reserved']
+            sn['contribution_required'] = sn['staking_requirement'] - sn['total_contributed']
+            sn['num_contributions'] = sum(len(x['locked_contributions']) for x in sn['contributors'] if 'locked_contributions' in x)
+            if sn['active']:
+                sn['state'] = 'active'
+            elif sn['funded']:
+                sn['state'] = 'decommissioned'
+                sn['decomm_blocks_remaining'] = max(sn['earned_downtime_blocks'], 0)
+                sn['decomm_blocks'] = height - sn['state_height']
+            else:
+                sn['state'] = 'awaiting'
+
+            self.nodes.append(sn)
+            self.by_pubkey[sn['service_node_pubkey']] = sn
+            self.by_state[sn['state']].append(sn)
+            self.by_swarm.setdefault(sn['swarm_id'], []).append(sn)
+            self.by_operator.setdefault(sn['operator_address'], []).append(sn)
+            self.by_version.setdefault(sn_version(sn), []).append(sn)
+
+            if sn['funded']:
+                self.stats['funded'] += 1
+                self.stats['active' if sn['active'] else 'decommissioned'] += 1
+            else:
+                self.stats['awaiting_contribution'] += 1
+            self.stats['staked'] += sn['total_contributed']
+
+        for state, key in state_orders.items():
+            self.by_state[state].sort(key=key)
+        self.active_swarms = len(set(sn['swarm_id'] for sn in self.by_state['active']))
+
+    def query(self, state=None, swarm_id=None, operator=None, version=None):
+        """Returns the list of service nodes matching all of the given (non-None) criteria"""
+        matches = [index.get(value, []) for index, value in (
+                (self.by_state, state), (self.by_swarm, swarm_id), (self.by_operator, operator), (self.by_version, version))
+            if value is not None]
+        if not matches:
+            return self.nodes
+        # Start with the smallest candidate list, and whittle it down by the others:
+        matches.sort(key=len)
+        result = matches[0]
+        for m in matches[1:]:
+            keep = set(sn['service_node_pubkey'] for sn in m)
+            result = [sn for sn in result if sn['service_node_pubkey'] in keep]
+        return result
+
+    def page(self, sns, sort='pubkey', desc=None, page=0, per_page=100):
+        """Returns one page of the given list of service nodes in the given sort order (one of the
+        keys of `sort_orders`).  `desc` defaults to the natural order of the sort."""
+        key, default_desc = sort_orders[sort]
+        if desc is None:
+            desc = default_desc
+        return sorted(sns, key=key, reverse=desc)[page*per_page:(page+1)*per_page]
+
+
+# The service node values that sn_changes looks at
+change_fields = ('state', 'last_uptime_proof', 'service_node_version', 'total_contributed', 'total_reserved',
+        'num_contributions', 'requested_unlock_height')
+
+def sn_changes(old, new):
+    """Returns a list of the changes between two sets of service nodes, given as dicts of pubkey =>
+    service node (e.g. ServiceNodeSet.by_pubkey, or a `change_snapshot`).  Each change is a dict of
+    the change 'type', the service node 'pubkey', and values relevant to the change.  The types are:
+
+    - registration -- a new service node (with its 'state')
+    - deregistration -- a service node that has been removed from the list (whether deregistered or
+      unlocked)
+    - activation -- an awaiting service node became fully funded, and so active
+    - decommission, recommission -- a service node was decommissioned or recommissioned
+    - uptime_proof -- a new uptime proof was received (with its 'last_uptime_proof' time and the
+      'service_node_version')
+    - contribution -- the contributions changed (with the new 'total_contributed',
+      'total_reserved' and 'num_contributions')
+    - unlock -- an unlock was requested (with the 'requested_unlock_height')
+    """
+    changes = []
+    for pk, sn in new.items():
+        was = old.get(pk)
+        if was is None:
+            changes.append({'type': 'registration', 'pubkey': pk, 'state': sn['state']})
+            continue
+        if sn['state'] != was['state']:
+            changes.append({'type': {
+                    ('awaiting', 'active'): 'activation',
+                    ('active', 'decommissioned'): 'decommission',
+                    ('decommissioned', 'active'): 'recommission',
+                }.get((was['state'], sn['state']), sn['state']), 'pubkey': pk})
+        if sn['last_uptime_proof'] != was['last_uptime_proof']:
+            changes.append({'type': 'uptime_proof', 'pubkey': pk, 'last_uptime_proof': sn['last_uptime_proof'],
+                'service_node_version': sn['service_node_version']})
+        if (sn['total_contributed'], sn['total_reserved'], sn['num_contributions']) != (
+                was['total_contributed'], was['total_reserved'], was['num_contributions']):
+            changes.append({'type': 'contribution', 'pubkey': pk, 'total_contributed': sn['total_contributed'],
+                'total_reserved': sn['total_reserved'], 'num_contributions': sn['num_contributions']})
+        if sn['requested_unlock_height'] != was['requested_unlock_height'] and sn['requested_unlock_height']:
+            changes.append({'type': 'unlock', 'pubkey': pk, 'requested_unlock_height': sn['requested_unlock_height']})
+    for pk in old:
+        if pk not in new:
+            changes.append({'type': 'deregistration', 'pubkey': pk})
+    return changes
+
+
+def change_snapshot(sns):
+    """Returns just what sn_changes needs of a ServiceNodeSet, in a JSON-serializable form"""
+    return {pk: {f: sn[f] for f in change_fields} for pk, sn in sns.by_pubkey.items()}
+
+
+def source_key(sn_states, height):
+    """Returns a cheap identifier of the service node list in a `get_service_nodes` response (which
+    is not necessarily the same object each time, e.g. with the uwsgi cache every hit is parsed
+    anew): within a block the list only changes through new uptime proofs."""
+    states = sn_states.get('service_node_states', [])
+    return (height, sn_states.get('height'), sn_states.get('block_hash'), len(states),
+            max((sn.get('last_uptime_proof', 0) for sn in states), default=0))
+
+
+class SharedChangeLog():
+    """Service node change log stored in a sqlite database, so that it is shared by all the observer
+    processes using the same file (and survives restarts).  Along with the changes, the database
+    holds a snapshot of the service node list that the last changes were computed against: each
+    process records a new list by diffing it against that snapshot (rather than against its own
+    previous list) inside a write transaction, so a change is recorded exactly once, by whichever
+    process sees the new list first.  The cursor epoch is stored in the database too, and so is the
+    same for every process.
+
+    The (height, newest uptime proof, digest) of the newest list we have recorded or found stored is
+    also kept in memory, so that lists we already know to be recorded (or outdated) are skipped
+    without serializing them or taking the database write lock.
+    """
+
+    def __init__(self, path, max_changes):
+        self.path = path
+        self.max_changes = max_changes
+        self.local = threading.local()
+        self.latest = (0, 0, b'')
+        db = self._db()
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sn_change_state (
+                id INTEGER PRIMARY KEY CHECK(id = 0),
+                epoch TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                newest_proof INTEGER NOT NULL,
+                digest BLOB NOT NULL,
+                snapshot TEXT NOT NULL
+            )""")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sn_changes (
+                seq INTEGER PRIMARY KEY,
+                change TEXT NOT NULL
+            )""")
+        db.execute("INSERT OR IGNORE INTO sn_change_state (id, epoch, seq, height, newest_proof, digest, snapshot) VALUES (0, ?, 0, 0, 0, x'', '')",
+                (os.urandom(4).hex(),))
+
+    def _db(self):
+        # sqlite connections can't be shared across threads, so we make one per thread:
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self.local.db = db
+        return db
+
+    def record(self, sns):
+        """Records the changes from the stored snapshot to ServiceNodeSet `sns`, unless the stored
+        snapshot is already for the same list, or for a newer one.  (Different processes can be
+        holding lists fetched at different times, so we have to make sure not to go backwards: lists
+        are ordered by height and then by the most recent uptime proof they include.)"""
+        newest_proof = max((sn['last_uptime_proof'] for sn in sns.nodes), default=0)
+        if (sns.height, newest_proof) < self.latest[:2]:
+            return
+        snapshot = change_snapshot(sns)
+        serialized = json.dumps(snapshot, sort_keys=True)
+        digest = hashlib.blake2b(serialized.encode(), digest_size=16).digest()
+        if digest == self.latest[2]:
+            return
+        db = self._db()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                epoch, seq, height, old_newest_proof, old_digest = db.execute(
+                        "SELECT epoch, seq, height, newest_proof, digest FROM sn_change_state WHERE id = 0").fetchone()
+                if digest == old_digest or (height, old_newest_proof) > (sns.height, newest_proof):
+                    db.execute("ROLLBACK")
+                    self.latest = (height, old_newest_proof, old_digest)
+                    return
+                if old_digest:
+                    old = json.loads(db.execute("SELECT snapshot FROM sn_change_state WHERE id = 0").fetchone()[0])
+                    now = int(time.time())
+                    for c in sn_changes(old, snapshot):
+                        seq += 1
+                        db.execute("INSERT INTO sn_changes (seq, change) VALUES (?, ?)", (seq, json.dumps(
+                            {'cursor': '{}-{}'.format(epoch, seq), 'height': sns.height, 'time': now, **c})))
+                    db.execute("DELETE FROM sn_changes WHERE seq <= ?", (seq - self.max_changes,))
+                db.execute("UPDATE sn_change_state SET seq = ?, height = ?, newest_proof = ?, digest = ?, snapshot = ? WHERE id = 0",
+                        (seq, sns.height, newest_proof, digest, serialized))
+                db.execute("COMMIT")
+                self.latest = (sns.height, newest_proof, digest)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print("Something getting wrong: unable to record service node changes: {}".format(e), file=sys.stderr)
+
+    def changes_since(self, cursor):
+        """Same as SNRegistry.changes_since"""
+        epoch, _, since = (cursor or '').partition('-')
+        try:
+            db = self._db()
+            cur_epoch, seq = db.execute("SELECT epoch, seq FROM sn_change_state WHERE id = 0").fetchone()
+            current = '{}-{}'.format(cur_epoch, seq)
+            oldest = max(seq - self.max_changes, 0)
+            if epoch != cur_epoch or not since.isdigit() or not oldest <= int(since) <= seq:
+                return [], current, True
+            changes = [json.loads(c) for c, in db.execute(
+                    "SELECT change FROM sn_changes WHERE seq > ? AND seq <= ? ORDER BY seq", (int(since), seq))]
+            return changes, current, False
+        except sqlite3.Error as e:
+            print("Something getting wrong: unable to load service node changes: {}".format(e), file=sys.stderr)
+            return [], cursor, True
+
+
+class SNRegistry():
+    """Holds the ServiceNodeSet for the most recent service node list, so that it only gets rebuilt
+    when the list (or chain height) actually changes rather than for every request.
+
+    Each rebuild is diffed against the previous list (see `sn_changes`), and the changes are kept,
+    up to `max_changes` of them, for pollers to fetch via `changes_since`.  Changes are numbered
+    by a cursor of the form EPOCH-SEQ.
+
+    If `config.sn_changes_db` is set the changes are kept in that database (see SharedChangeLog),
+    which all processes share; new lists are recorded there by a background thread, so that request
+    handlers don't wait on the database.  Otherwise each process keeps its own changes in memory, with an
+    epoch unique to the process, so that a cursor from another process (or from before a restart)
+    is not valid: that is only useful when running a single process.
+    """
+
+    def __init__(self, max_changes=10000):
+        self.lock = threading.Lock()
+        self.source = None  # source_key() of the list `sns` was built from
+        self.sns = None
+        self.max_changes = max_changes
+        self.epoch = os.urandom(4).hex()
+        self.seq = 0
+        self.changes = deque(maxlen=max_changes)
+        self.log = None
+        self.pending = None
+        self.recorder = None
+        self.record_wanted = threading.Event()
+
+    @property
+    def shared(self):
+        return bool(config.sn_changes_db)
+
+    def shared_log(self):
+        # Created on first use rather than when constructed, so that the per-network config (e.g.
+        # mainnet.py), which gets loaded after us, can set the path.
+        if self.log is None:
+            with self.lock:
+                if self.log is None:
+                    self.log = SharedChangeLog(config.sn_changes_db, self.max_changes)
+        return self.log
+
+    def queue_record(self, sns):
+        """Hands `sns` to the thread recording lists in the shared change log.  If that falls behind
+        only the most recent list gets recorded, which is fine: changes are always worked out
+        against the stored list."""
+        with self.lock:
+            self.pending = sns
+            if self.recorder is None:
+                self.recorder = threading.Thread(target=self.run_recorder, name='sn-change-recorder', daemon=True)
+                self.recorder.start()
+        self.record_wanted.set()
+
+    def run_recorder(self):
+        while True:
+            self.record_wanted.wait()
+            self.record_wanted.clear()
+            with self.lock:
+                sns, self.pending = self.pending, None
+            if sns is not None:
+                self.shared_log().record(sns)
+
+    def cursor(self):
+        return '{}-{}'.format(self.epoch, self.seq)
+
+    def changes_since(self, cursor):
+        """Returns (changes, cursor, reset) where `changes` is the list of changes after `cursor`,
+        and `cursor` is the cursor to pass next time.  `reset` is True (and `changes` empty) if the
+        changes since the given cursor are not available, in which case the caller needs to start
+        over from the full service node list."""
+        if self.shared:
+            return self.shared_log().changes_since(cursor)
+        epoch, _, seq = (cursor or '').partition('-')
+        with self.lock:
+            oldest = self.seq - len(self.changes)
+            if epoch != self.epoch or not seq.isdigit() or not oldest <= int(seq) <= self.seq:
+                return [], self.cursor(), True
+            changes = list(self.changes)[len(self.changes) - (self.seq - int(seq)):]
+            return changes, self.cursor(), False
+
+    def get(self, sn_states, height):
+        """Returns the ServiceNodeSet for the given `get_service_nodes` response and chain height"""
+        if sn_states is None:
+            # Request failed; the last set is the best we can do
+            return self.sns or ServiceNodeSet([], height)
+        key = source_key(sn_states, height)
+        with self.lock:
+            if key == self.source:
+                return self.sns
+        sns = ServiceNodeSet(sn_states.get('service_node_states', []), height)
+        with self.lock:
+            if self.sns is not None and self.sns.height > height:
+                # Another thread already got a newer list
+                return sns
+            if self.sns is not None and not self.shared:
+                now = int(time.time())
+                for c in sn_changes(self.sns.by_pubkey, sns.by_pubkey):
+                    self.seq += 1
+                    self.changes.append({'cursor': self.cursor(), 'height': height, 'time': now, **c})
+            self.source, self.sns = key, sns
+        if self.shared:
+            self.queue_record(sns)
+        return sns
@@ -2,3 +2,5 @@ from observer import app, config
 import oxenmq
 
 config.oxend_rpc = oxenmq.Address('ipc://oxend/testnet.sock')
+config.emission_db = 'testnet-emission.db'
+config.sn_changes_db = 'testnet-sn-changes.db'
@@ -0,0 +1,11 @@
+import os
+import sys
+
+tests = os.path.dirname(os.path.abspath(__file__))
+
+# The observer modules live in the top-level directory rather than in a package
+sys.path.insert(0, os.path.join(tests, '..'))
+sys.path.insert(0, tests)
+# ... and talk to oxend through oxenmq, which the tests replace with a stub (see stubs/oxenmq.py)
+# so that they need neither oxend nor oxenmq itself.
+sys.path.insert(0, os.path.join(tests, 'stubs'))
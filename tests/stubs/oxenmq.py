@@ -0,0 +1,97 @@
+# A stand-in for the parts of the oxenmq module that the observer uses, for tests: requests are
+# answered (from a separate thread, as OxenMQ does) with the reply set for their endpoint in
+# `replies`, and recorded in `sent`.
+
+import threading
+import time
+
+# endpoint => (delay in seconds, reply), where the reply is the list of response parts (e.g.
+# [b'200', b'{...}']) or a function taking the request args and returning them.
+replies = {}
+default_reply = (0, [b'200', b'{}'])
+
+sent = []            # (endpoint, args) of every request
+instances = []       # every OxenMQ object created
+connections = []     # every connect_remote() result
+lock = threading.Lock()
+
+
+def reset():
+    with lock:
+        replies.clear()
+        del sent[:]
+        del instances[:]
+        del connections[:]
+
+
+class LogLevel:
+    trace, debug, info, warn, error, fatal = range(6)
+
+
+class AuthLevel:
+    denied, none, basic, admin = range(4)
+
+
+class Address:
+    def __init__(self, addr):
+        self.addr = addr
+
+
+class Category:
+    def add_command(self, name, callback):
+        pass
+
+    def add_request_command(self, name, callback):
+        pass
+
+
+class OxenMQ:
+    def __init__(self, log_level=LogLevel.warn):
+        self.log_level = log_level
+        self.started = False
+        # Make concurrent construction more likely to overlap (and thus show up) in tests:
+        time.sleep(0.001)
+        with lock:
+            instances.append(self)
+
+    def add_category(self, name, access_level, reserved_threads=0, max_queue=200):
+        return Category()
+
+    def start(self):
+        self.started = True
+
+    def connect_remote(self, addr):
+        time.sleep(0.001)
+        conn = object()
+        with lock:
+            connections.append(conn)
+        return conn
+
+    def request(self, conn, endpoint, callback, args=[], timeout=None):
+        with lock:
+            sent.append((endpoint, args))
+            delay, reply = replies.get(endpoint, default_reply)
+        if callable(reply):
+            reply = reply(args)
+        t = threading.Timer(delay, callback, (True, reply))
+        t.daemon = True
+        t.start()
+
+    def request_future(self, conn, endpoint, args=[], timeout=None):
+        f = RequestFuture()
+        self.request(conn, endpoint, f.on_reply, args, timeout)
+        return f
+
+
+class RequestFuture:
+    def __init__(self):
+        self.done = threading.Event()
+        self.reply = None
+
+    def on_reply(self, success, data):
+        self.reply = data
+        self.done.set()
+
+    def get(self):
+        self.done.wait()
+        return self.reply
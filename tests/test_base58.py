@@ -0,0 +1,123 @@
+import hashlib
+import os
+import random
+
+import pytest
+
+import base58
+import base58_reference as reference
+
+
+def random_data(count=500, max_size=100, seed=58):
+    rng = random.Random(seed)
+    return [bytes(rng.randrange(256) for _ in range(rng.randrange(max_size + 1))) for _ in range(count)]
+
+# Every block size (full and partial) filled with all 0x00 and all 0xff bytes, alone and following
+# full blocks
+edge_data = [bytes([b]) * n for b in (0, 0xff) for n in range(0, 35)]
+
+
+@pytest.mark.parametrize('data', random_data() + edge_data)
+def test_matches_reference(data):
+    enc = base58.encode(data.hex())
+    assert enc == reference.encode(data.hex())
+    assert base58.encode_bytes(data) == enc
+    assert base58.decode(enc) == reference.decode(enc) == data.hex()
+    assert base58.decode_bytes(enc) == data
+
+
+def test_encoded_sizes():
+    for n in range(0, 9):
+        assert len(base58.encode_bytes(b'\xff' * n)) == base58.encoded_block_sizes[n]
+    assert len(base58.encode_bytes(b'\0' * 69)) == 8 * 11 + 7
+    assert base58.encode_bytes(b'\0' * 8) == '1' * 11
+
+
+def test_many():
+    data = random_data(50)
+    enc = base58.encode_many(data)
+    assert enc == [base58.encode_bytes(d) for d in data]
+    assert base58.decode_many(enc) == data
+
+
+@pytest.mark.parametrize('enc', [
+    '0' * 11,                # '0', 'O', 'I' and 'l' aren't in the alphabet
+    '1111111111O',
+    'I1',
+    '11l',
+    '11+',
+    '111111111é1',
+    '\0\0',
+])
+def test_invalid_chars(enc):
+    with pytest.raises(ValueError):
+        base58.decode_bytes(enc)
+    with pytest.raises(ValueError):
+        reference.decode(enc)
+
+
+@pytest.mark.parametrize('size', [1, 4, 8, 12, 15, 19])
+def test_invalid_lengths(size):
+    # Sizes that no number of bytes encodes to (a block of 1, 4 or 8 characters)
+    enc = '2' * size
+    with pytest.raises(ValueError):
+        base58.decode_bytes(enc)
+    with pytest.raises(ValueError):
+        reference.decode(enc)
+
+
+@pytest.mark.parametrize('enc', ['zzzzzzzzzzz', '1111111111zzz', 'zz', 'zzz', 'zzzzz'])
+def test_overflow(enc):
+    # Blocks whose value doesn't fit in the number of bytes they decode to
+    with pytest.raises(ValueError):
+        base58.decode_bytes(enc)
+
+
+@pytest.fixture
+def checksum(monkeypatch):
+    """Uses the real (keccak) address checksum if pycryptodome is available, and otherwise a
+    stand-in, which is enough to test the checksum handling itself"""
+    try:
+        import Cryptodome  # noqa: F401
+    except ImportError:
+        monkeypatch.setattr(base58, 'address_checksum',
+                lambda data: hashlib.sha3_256(data).digest()[:base58.checksum_size])
+    return base58.address_checksum
+
+
+def test_address_roundtrip(checksum):
+    for data in random_data(50, 80):
+        data = b'\x72' + data
+        addr = base58.encode_address(data)
+        assert base58.decode_bytes(addr) == data + checksum(data)
+        assert base58.decode_address(addr) == data
+        assert base58.valid_address(addr)
+
+
+def test_address_checksum_failures(checksum):
+    data = b'\x72' + os.urandom(64)
+    addr = base58.encode_address(data)
+    # Change one character of the address (to another one that still decodes):
+    for i in (0, 20, len(addr) - 1):
+        for c in '23':
+            bad = addr[:i] + c + addr[i+1:]
+            if bad == addr:
+                continue
+            try:
+                base58.decode_bytes(bad)
+            except ValueError:
+                continue
+            with pytest.raises(ValueError):
+                base58.decode_address(bad)
+            assert not base58.valid_address(bad)
+    # Wrong checksum, and too short to even have one:
+    assert not base58.valid_address(base58.encode_bytes(data + b'\0\0\0\0'))
+    assert not base58.valid_address(base58.encode_bytes(b'\1\2\3'))
+    assert not base58.valid_address('')
+    assert not base58.valid_address('0OIl')
+
+
+def test_known_checksum():
+    # keccak-256 (not sha3-256!) of the empty string, as used by the real address checksum
+    pytest.importorskip('Cryptodome')
+    assert base58.address_checksum(b'') == bytes.fromhex('c5d24601')
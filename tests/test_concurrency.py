@@ -0,0 +1,201 @@
+import copy
+import json
+import random
+import threading
+
+import pytest
+
+import oxenmq  # the stub (see conftest.py)
+import config
+import lmq
+from lmq import FutureJSON, LRUCache, StripedCache, omq_connection
+
+
+def run_threads(count, f):
+    """Runs f(i) in `count` threads, started together; re-raises the first failure"""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            f(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    if errors:
+        raise errors[0]
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    """Gives each test a new connection, cache and stub oxenmq"""
+    oxenmq.reset()
+    monkeypatch.setattr(config, 'oxend_rpc', oxenmq.Address('ipc://stub'))
+    monkeypatch.setattr(config, 'notifications', False)
+    monkeypatch.setattr(config, 'persistent_cache', None)
+    monkeypatch.setattr(config, 'uwsgi_cache', None)
+    monkeypatch.setattr(config, 'refresh_endpoints', set())
+    monkeypatch.setattr(lmq, 'omq', None)
+    monkeypatch.setattr(lmq, 'oxend', None)
+    monkeypatch.setattr(lmq, 'cache', None)
+    lmq.inflight.clear()
+    yield
+    lmq.inflight.clear()
+
+
+def test_concurrent_connection():
+    results = [None] * 50
+    def connect(i):
+        results[i] = omq_connection()
+    run_threads(50, connect)
+
+    assert len(oxenmq.instances) == 1
+    assert len(oxenmq.connections) == 1
+    assert all(r == results[0] for r in results)
+    assert results[0] == (oxenmq.instances[0], oxenmq.connections[0])
+    assert oxenmq.instances[0].started
+
+
+def test_concurrent_requests_coalesce():
+    oxenmq.replies['rpc.get_info'] = (0.2, [b'200', b'{"height": 1234}'])
+    results = [None] * 30
+    def get(i):
+        omq, oxend = omq_connection()
+        results[i] = FutureJSON(omq, oxend, 'rpc.get_info', 1).get()
+    run_threads(30, get)
+
+    assert [e for e, _ in oxenmq.sent] == ['rpc.get_info']
+    assert all(r is results[0] for r in results)
+    assert results[0] == {'height': 1234}
+    assert not lmq.inflight
+
+
+def check_cache(c):
+    assert c.size == sum(entry[3] for entry in c.data.values())
+    assert c.size <= c.max_bytes
+    assert len(c.data) <= c.max_entries
+
+
+@pytest.mark.parametrize('cache', [
+    lambda: LRUCache(100, 20000),
+    lambda: StripedCache(8, 200, 40000),
+])
+def test_cache_consistency(cache):
+    cache = cache()
+    gets = [0] * 16
+    def work(i):
+        rng = random.Random(i)
+        for _ in range(5000):
+            key = ('rpc.test', '', str(rng.randrange(500)).encode())
+            if rng.random() < 0.5:
+                # Sizes up to larger than a whole stripe's limit (which don't get cached at all)
+                raw = b'x' * rng.choice([10, 100, 1000, 6000])
+                cache.set(key, {'v': key}, raw, rng.choice([0, 10]), rng.choice([0, 10]))
+            else:
+                gets[i] += 1
+                value = cache.get(key, stale=rng.random() < 0.5)
+                assert value is None or value == {'v': key}
+    run_threads(16, work)
+
+    stripes = cache.stripes if isinstance(cache, StripedCache) else [cache]
+    for s in stripes:
+        check_cache(s)
+    assert cache.size == sum(s.size for s in stripes)
+    # Every lookup is counted exactly once:
+    stats = cache.stats
+    assert stats['hits'] + stats['stale'] + stats['misses'] == sum(gets)
+    assert stats['hits'] > 0
+
+
+def test_cache_stats_count_every_lookup():
+    cache = StripedCache(8, 100, 100000)
+    key = ('rpc.test', '', None)
+    cache.set(key, {}, b'{}', 10)
+    run_threads(16, lambda i: [cache.get(key) for _ in range(1000)])
+    assert cache.stats['hits'] == 16000
+
+
+# The rest needs the observer itself (and thus flask)
+
+@pytest.fixture(scope='module')
+def observer():
+    pytest.importorskip('flask')
+    import observer
+    return observer
+
+
+def fake_tx(txid, height):
+    info = {'version': 4, 'type': 0, 'vin': [{'key': {'amount': 0}}], 'vout': [{'amount': 0}] * 2,
+            'extra': [1, 2, 3, 255], 'rct_signatures': {'type': 5, 'txnFee': 1000}}
+    return {'tx_hash': txid, 'block_height': height, 'size': 1500, 'extra': {}, 'as_json': json.dumps(info)}
+
+
+def test_parse_txs_leaves_response(observer):
+    rpc = {'status': 'OK', 'txs': [fake_tx('{:064x}'.format(i), 100 + i) for i in range(5)]}
+    orig = copy.deepcopy(rpc)
+    results = [None] * 8
+    def parse(i):
+        results[i] = observer.parse_txs(rpc)
+    run_threads(8, parse)
+
+    assert rpc == orig
+    for txs in results:
+        assert [tx['tx_hash'] for tx in txs] == [tx['tx_hash'] for tx in orig['txs']]
+        assert all(tx['info']['extra'] == '010203ff' and 'as_json' not in tx for tx in txs)
+    # Each caller gets its own copies
+    assert results[0][0] is not results[1][0]
+
+
+def test_parse_block_leaves_response(observer):
+    block = {'status': 'OK', 'block_header': {'height': 100, 'hash': 'ab' * 32},
+            'json': json.dumps({'major_version': 19, 'miner_tx': {'vin': []}, 'tx_hashes': []})}
+    orig = copy.deepcopy(block)
+    results = [None] * 8
+    def parse(i):
+        results[i] = observer.parse_block(block)
+    run_threads(8, parse)
+
+    assert block == orig
+    for b in results:
+        assert b['info'] == {'major_version': 19, 'tx_hashes': []}
+        assert 'json' not in b
+
+
+def test_get_block_range_leaves_cached_responses(observer, monkeypatch):
+    monkeypatch.setattr(config, 'index_db', None)
+    heights = range(100, 110)
+    headers = {'status': 'OK', 'headers': [
+        {'height': h, 'hash': '{:064x}'.format(h), 'miner_tx_hash': '{:063x}m'.format(h),
+            'tx_hashes': ['{:062x}t{}'.format(h, i) for i in range(h % 3)]} for h in heights]}
+    txs = {'status': 'OK', 'txs': [fake_tx(txid, h['height'])
+        for h in headers['headers'] for txid in [h['miner_tx_hash']] + h['tx_hashes']]}
+    oxenmq.replies['rpc.get_block_headers_range'] = (0.05, [b'200', json.dumps(headers).encode()])
+    oxenmq.replies['rpc.get_transactions'] = (0.05, [b'200', json.dumps(txs).encode()])
+
+    results = [None] * 16
+    def get(i):
+        omq, oxend = omq_connection()
+        results[i] = observer.get_block_range(omq, oxend, 100, 109)
+    run_threads(16, get)
+
+    # All the threads shared the (coalesced) requests...
+    assert sorted(e for e, _ in oxenmq.sent) == ['rpc.get_block_headers_range', 'rpc.get_transactions']
+    # ... but the cached responses they shared are unchanged:
+    omq, oxend = omq_connection()
+    cached_headers = observer.block_range_req(omq, oxend, 100, 109).get()
+    assert cached_headers == headers
+    cached_txs = observer.block_range_txs_req(omq, oxend, cached_headers['headers']).get()
+    assert cached_txs == txs
+    assert len(oxenmq.sent) == 2
+
+    for blocks in results:
+        assert [b['height'] for b in blocks] == list(heights)
+        assert [len(b['txs']) for b in blocks] == [1 + h % 3 for h in heights]
+        assert all(tx['block_height'] == b['height'] for b in blocks for tx in b['txs'])
+    assert results[0][0] is not results[1][0]
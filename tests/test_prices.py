@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+pytest.importorskip('requests')
+
+import config
+from prices import PriceTicker
+
+
+class CoinGecko():
+    """A local stand-in for the CoinGecko API.  `responses` maps a path to the (status, body) to
+    send back (a dict body is sent as JSON); `delay` makes every response that much slower."""
+
+    def __init__(self):
+        self.responses = {
+            '/simple/supported_vs_currencies': (200, ['usd', 'eur', 'btc']),
+            '/simple/price': (200, {config.price_ticker: {'usd': 1.5, 'eur': 1.25, 'btc': 0.00002}}),
+        }
+        self.delay = 0
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                stand_in.requests.append((url.path, parse_qs(url.query)))
+                time.sleep(stand_in.delay)
+                status, body = stand_in.responses.get(url.path, (404, {'error': 'not found'}))
+                body = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def park(ticker):
+    """Keeps a started ticker's thread (which can't be stopped) off the network after the test"""
+    ticker.update = lambda: None
+
+
+@pytest.fixture
+def coingecko(monkeypatch):
+    cg = CoinGecko()
+    monkeypatch.setattr(config, 'price_api_url', cg.url)
+    monkeypatch.setattr(config, 'price_timeout', 1)
+    yield cg
+    cg.server.shutdown()
+    cg.server.server_close()
+
+
+def test_update(coingecko):
+    ticker = PriceTicker()
+    ticker.update()
+    assert ticker.prices == {'usd': 1.5, 'eur': 1.25, 'btc': 0.00002}
+    assert coingecko.requests[-1] == ('/simple/price', {
+        'ids': [config.price_ticker], 'vs_currencies': ['usd,eur,btc']})
+
+
+def test_currencies_refresh(coingecko, monkeypatch):
+    ticker = PriceTicker()
+    ticker.update()
+    ticker.update()
+    paths = [path for path, _ in coingecko.requests]
+    assert paths == ['/simple/supported_vs_currencies', '/simple/price', '/simple/price']
+
+    # A failure to refresh expired currencies keeps using the old list
+    ticker.currencies_expire = 0
+    coingecko.responses['/simple/supported_vs_currencies'] = (500, {'error': 'oops'})
+    ticker.update()
+    assert ticker.currencies == ['usd', 'eur', 'btc']
+    assert coingecko.requests[-1][0] == '/simple/price'
+
+
+@pytest.mark.parametrize('response', [
+    (500, {'error': 'oops'}),
+    (429, {'error': 'rate limited'}),
+    (200, b'{not json'),
+    (200, {}),
+    (200, {config.price_ticker: {}}),
+])
+def test_failures_keep_last_prices(coingecko, response):
+    ticker = PriceTicker()
+    ticker.update()
+    coingecko.responses['/simple/price'] = response
+    with pytest.raises(Exception):
+        ticker.update()
+    assert ticker.prices == {'usd': 1.5, 'eur': 1.25, 'btc': 0.00002}
+
+
+def test_timeout(coingecko):
+    import requests
+    coingecko.delay = 2
+    ticker = PriceTicker()
+    start = time.time()
+    with pytest.raises(requests.RequestException):
+        ticker.update()
+    assert time.time() - start < 1.9
+    assert ticker.prices is None
+
+
+def wait_for_prices(ticker, prices, timeout=5):
+    deadline = time.time() + timeout
+    while ticker.get() != prices and time.time() < deadline:
+        time.sleep(0.01)
+    return ticker.get() == prices
+
+
+def test_started_thread(coingecko, monkeypatch):
+    monkeypatch.setattr(config, 'price_refresh_interval', 0.05)
+    ticker = PriceTicker()
+    assert ticker.thread is None
+    # The first get() starts the thread, but doesn't wait for it
+    coingecko.delay = 0.2
+    assert ticker.get() is None
+    thread = ticker.thread
+    assert thread is not None
+    coingecko.delay = 0
+    assert wait_for_prices(ticker, {'usd': 1.5, 'eur': 1.25, 'btc': 0.00002})
+    ticker.start()
+    assert ticker.thread is thread
+
+    coingecko.responses['/simple/price'] = (200, {config.price_ticker: {'usd': 2}})
+    assert wait_for_prices(ticker, {'usd': 2})
+
+    # Failures keep serving the last prices
+    coingecko.responses['/simple/price'] = (503, {'error': 'down'})
+    time.sleep(0.2)
+    assert ticker.get() == {'usd': 2}
+    park(ticker)
+
+
+def test_unavailable(coingecko):
+    coingecko.responses['/simple/supported_vs_currencies'] = (500, {'error': 'down'})
+    ticker = PriceTicker()
+    assert ticker.get() is None
+    deadline = time.time() + 5
+    while not coingecko.requests and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert ticker.get() is None
+    park(ticker)
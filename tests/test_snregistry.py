@@ -0,0 +1,131 @@
+import copy
+import json
+import time
+
+import pytest
+
+import config
+from snregistry import SNRegistry, ServiceNodeSet
+
+
+def fake_sn(i, proof=1000):
+    return {
+        'service_node_pubkey': '{:064x}'.format(i), 'requested_unlock_height': 0,
+        'last_reward_block_height': 100 + i, 'last_reward_transaction_index': 0, 'active': True,
+        'funded': True, 'earned_downtime_blocks': 0, 'service_node_version': [9, 1, i % 3],
+        'contributors': [{'address': 'T' + str(i), 'amount': 100, 'locked_contributions': [{'amount': 100}]}],
+        'total_contributed': 100, 'total_reserved': 100, 'staking_requirement': 100,
+        'portions_for_operator': 0, 'operator_address': 'T' + str(i), 'pubkey_ed25519': '{:064x}'.format(i),
+        'last_uptime_proof': proof + i, 'state_height': 50, 'swarm_id': i % 4,
+    }
+
+
+def sn_response(sns, height=200, block_hash='aa' * 32):
+    # Round-tripped through JSON, as every hit on the uwsgi cache is
+    return json.loads(json.dumps({'status': 'OK', 'height': height, 'block_hash': block_hash,
+        'service_node_states': sns}))
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(config, 'sn_changes_db', None)
+    return SNRegistry(100)
+
+
+def test_same_list_not_rebuilt(registry):
+    sns = [fake_sn(i) for i in range(20)]
+    first = registry.get(sn_response(sns), 200)
+    # An equal, but separately parsed, response gives the same (not a rebuilt) set:
+    assert registry.get(sn_response(sns), 200) is first
+    assert registry.get(sn_response(copy.deepcopy(sns)), 200) is first
+    assert registry.changes_since(registry.cursor()) == ([], registry.cursor(), False)
+
+
+def test_changed_list_rebuilt(registry):
+    sns = [fake_sn(i) for i in range(20)]
+    first = registry.get(sn_response(sns), 200)
+    cursor = registry.cursor()
+
+    # A new uptime proof within the same block:
+    sns[3] = dict(sns[3], last_uptime_proof=5000)
+    second = registry.get(sn_response(sns), 200)
+    assert second is not first
+    assert second.by_pubkey[sns[3]['service_node_pubkey']]['last_uptime_proof'] == 5000
+    changes, cursor, reset = registry.changes_since(cursor)
+    assert not reset
+    assert [(c['type'], c['pubkey']) for c in changes] == [('uptime_proof', sns[3]['service_node_pubkey'])]
+
+    # A new block, and a new chain height:
+    assert registry.get(sn_response(sns, 201, 'bb' * 32), 201) is not second
+    third = registry.get(sn_response(sns, 201, 'bb' * 32), 202)
+    assert third.height == 202
+    assert registry.get(sn_response(sns, 201, 'bb' * 32), 202) is third
+    assert registry.changes_since(cursor)[0] == []
+
+
+def wait_for_changes(registry, cursor, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+        changes, new_cursor, reset = registry.changes_since(cursor)
+        if changes or reset or time.time() > deadline:
+            return changes, new_cursor, reset
+        time.sleep(0.01)
+
+
+class CountingDB():
+    """Wraps a sqlite connection, counting the write transactions started on it"""
+    def __init__(self, db):
+        self.db = db
+        self.writes = 0
+
+    def execute(self, sql, *args):
+        if sql == "BEGIN IMMEDIATE":
+            self.writes += 1
+        return self.db.execute(sql, *args)
+
+
+def test_shared_change_log(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'sn_changes_db', str(tmp_path / 'sn-changes.db'))
+    # Two registries (standing in for two processes) sharing the change log:
+    a, b = SNRegistry(100), SNRegistry(100)
+    sns = [fake_sn(i) for i in range(20)]
+    a.get(sn_response(sns), 200)
+    b.get(sn_response(sns), 200)
+    cursor = a.shared_log().changes_since(None)[1]
+    # Recording happens in the background:
+    deadline = time.time() + 5
+    while a.shared_log().latest[0] != 200 and time.time() < deadline:
+        time.sleep(0.01)
+
+    sns[5] = dict(sns[5], last_uptime_proof=9000)
+    b.get(sn_response(sns), 200)
+    changes, cursor_b, reset = wait_for_changes(b, cursor)
+    assert not reset
+    assert [(c['type'], c['pubkey']) for c in changes] == [('uptime_proof', sns[5]['service_node_pubkey'])]
+    # The same changes, with the same cursors, are seen through the other registry:
+    assert a.changes_since(cursor) == (changes, cursor_b, False)
+
+    # Recording the same list again (in either process) changes nothing:
+    a.get(sn_response(sns), 200)
+    time.sleep(0.2)
+    assert a.changes_since(cursor_b) == ([], cursor_b, False)
+
+
+def test_shared_log_skips_known_lists(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'sn_changes_db', str(tmp_path / 'sn-changes.db'))
+    registry = SNRegistry(100)
+    log = registry.shared_log()
+    db = CountingDB(log._db())
+    monkeypatch.setattr(log, '_db', lambda: db)
+
+    sns = [fake_sn(i) for i in range(20)]
+    first = ServiceNodeSet(sn_response(sns)['service_node_states'], 200)
+    log.record(first)
+    assert db.writes == 1
+    # Already recorded, or older than what has been recorded: no write transaction at all
+    log.record(ServiceNodeSet(sn_response(sns)['service_node_states'], 200))
+    log.record(ServiceNodeSet(sn_response(sns)['service_node_states'], 199))
+    assert db.writes == 1
+    sns[0] = dict(sns[0], last_uptime_proof=9000)
+    log.record(ServiceNodeSet(sn_response(sns)['service_node_states'], 200))
+    assert db.writes == 2
@@ -0,0 +1,147 @@
+import json
+import re
+import hashlib
+import threading
+from lmq import FutureJSON
+
+
+class PoolTx(dict):
+    """A mempool tx, in the same form as the entries of get_transaction_pool (which is what the
+    templates expect), except that the embedded tx json is only parsed into 'info' when first
+    accessed, so that only the txs that actually get displayed need to be decoded.  The fee is
+    extracted up front without a full parse so that txs can be sorted by it."""
+
+    def __missing__(self, key):
+        if key != 'info':
+            raise KeyError(key)
+        # Parsing is idempotent, so it doesn't matter if two threads race to do it
+        info = json.loads(self['_json'])
+        self['info'] = info
+        return info
+
+fee_re = re.compile(r'"txnFee":\s*(\d+)')
+
+def pool_tx(tx):
+    """Converts a get_transactions entry for a mempool tx into a PoolTx"""
+    fee = fee_re.search(tx['as_json'])
+    return PoolTx(
+        id_hash=tx['tx_hash'],
+        receive_time=tx.get('received_timestamp', 0),
+        blob_size=tx['size'],
+        fee=int(fee.group(1)) if fee else 0,
+        relayed=tx.get('relayed', False),
+        double_spend_seen=tx.get('double_spend_seen', False),
+        blink=tx.get('blink', False),
+        extra=tx.get('extra', {}),
+        stake_amount=tx.get('stake_amount'),
+        _json=tx['as_json'],
+    )
+
+
+# Mempool sort orders: name => (sort key, default to descending)
+sort_orders = {
+    'time': (lambda tx: (tx['receive_time'], tx['id_hash']), False),
+    'fee': (lambda tx: (tx['fee'], tx['id_hash']), True),
+    'size': (lambda tx: (tx['blob_size'], tx['id_hash']), True),
+}
+
+def mempool_page(view, sort='time', desc=None, page=0, per_page=100):
+    """Returns the txs of one page of a mempool view in the given sort order (one of the keys of
+    `sort_orders`; raises a KeyError for anything else).  `desc` defaults to the natural order
+    of the sort (oldest first for time; largest first for fee and size)."""
+    key, default_desc = sort_orders[sort]
+    if desc is None:
+        desc = default_desc
+    txs = view['transactions']
+    if sort != 'time' or desc:
+        txs = sorted(txs, key=key, reverse=desc)
+    return txs[page*per_page:(page+1)*per_page]
+
+
+class MempoolTracker():
+    """Keeps an in-memory, ordered view of the mempool that is updated incrementally: each refresh
+    fetches just the mempool tx hashes, then requests (and parses) details only for the txs we
+    haven't seen before, and drops txs that have left the mempool.  oxend's work (and the data
+    transferred) per refresh thus depends on how much the mempool changed rather than its size.
+
+    Requests for details of new txs are made by a background thread (one at a time, however many
+    requests notice the change), so that request handlers don't wait on oxend for them: until
+    the details arrive, handlers get the previous view.  Only the very first view is waited for.
+    Txs leaving the mempool don't need anything from oxend and so are dropped right away.
+
+    The view is a dict with 'transactions', the list of txs (see PoolTx) sorted by receive time,
+    'size', the total size of the txs, and 'version', which changes whenever the set of txs does.
+    Views are never modified once returned (other than txs lazily decoding their 'info'): changes
+    produce a new view.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes = None
+        self.view = {'transactions': [], 'size': 0, 'version': b''}
+        self.updater = None
+        self.loaded = threading.Event()
+
+    def get(self, omq, oxend):
+        """Returns the current mempool view, updating it first if the mempool has changed"""
+        hashes = FutureJSON(omq, oxend, 'rpc.get_transaction_pool_hashes', 5).get()
+        if hashes is None:
+            # Request failed; the last view is the best we can do
+            return self.view
+        hashes = hashes.get('tx_hashes', [])
+
+        with self.lock:
+            if hashes is self.hashes or hashes == self.hashes:
+                return self.view
+            have = {tx['id_hash']: tx for tx in self.view['transactions']}
+            if all(h in have for h in hashes):
+                # Only removals, which we can deal with right away
+                self.publish(hashes, have)
+                return self.view
+            if self.updater is None:
+                self.updater = threading.Thread(target=self.update, args=(omq, oxend, hashes, have),
+                        name='mempool-update', daemon=True)
+                self.updater.start()
+
+        if not self.loaded.is_set():
+            self.loaded.wait(15)
+        return self.view
+
+    def update(self, omq, oxend, hashes, have):
+        """Fetches the details of the new txs in `hashes`, then publishes the new view"""
+        try:
+            new = [h for h in hashes if h not in have]
+            txs = FutureJSON(omq, oxend, 'rpc.get_transactions', None, args={
+                'txs_hashes': new,
+                'decode_as_json': True,
+                'tx_extra': True,
+                'prune': True,
+                'stake_info': True,
+                }).get()
+            have = dict(have)
+            if txs and 'txs' in txs:
+                for tx in txs['txs']:
+                    # Could have been mined in between the two requests:
+                    if tx.get('in_pool'):
+                        have[tx['tx_hash']] = pool_tx(tx)
+            with self.lock:
+                self.publish(hashes, have)
+        finally:
+            with self.lock:
+                self.updater = None
+            # Even if we failed, so that nobody else waits for the first view:
+            self.loaded.set()
+
+    def publish(self, hashes, have):
+        """Makes the view of the txs in `hashes` (taken from `have`) current.  Must be called with
+        the lock held."""
+        transactions = [have[h] for h in hashes if h in have]
+        transactions.sort(key=lambda tx: (tx['receive_time'], tx['id_hash']))
+        # If we couldn't get some of the txs then we'll want to try again next time:
+        self.hashes = hashes if len(transactions) == len(hashes) else None
+        self.view = {
+            'transactions': transactions,
+            'size': sum(tx['blob_size'] for tx in transactions),
+            'version': hashlib.blake2b(''.join(sorted(tx['id_hash'] for tx in transactions)).encode(), digest_size=16).digest(),
+        }
+        self.loaded.set()